@@ -1,6 +1,7 @@
 
 # Import các thư viện cần thiết từ SQLAlchemy và các module khác
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -15,14 +16,41 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "db_password")  # Mật khẩu database
 DB_HOST = os.getenv("DB_HOST", "postgres")  # Địa chỉ host của database
 DB_NAME = os.getenv("DB_NAME", "sports_db")  # Tên database
 
+# Cấu hình connection pool (áp dụng cho cả engine sync và async, mỗi worker một pool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))  # Số kết nối giữ sẵn
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))  # Số kết nối mở thêm khi pool hết
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # Kiểm tra kết nối trước khi dùng
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Giây, đóng kết nối cũ hơn mức này
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))  # 0 = không giới hạn
+
+POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE,
+)
+
 # Tạo chuỗi kết nối tới PostgreSQL
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
 
 # Tạo engine để kết nối tới database
-engine = create_engine(DATABASE_URL)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"},
+    **POOL_OPTIONS,
+)
 # Tạo session factory để làm việc với database
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine async (asyncpg) cho các route `async def`, tránh chặn event loop khi chờ DB
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}},
+    **POOL_OPTIONS,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base dùng để khai báo các model ORM
 Base = declarative_base()
 
@@ -32,4 +60,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Phiên bản async của get_db, dùng cho các route `async def`
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
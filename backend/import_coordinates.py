@@ -0,0 +1,70 @@
+"""Nhập tọa độ sân từ file CSV (geocode offline).
+
+File CSV có header, mỗi dòng xác định sân bằng `id` hoặc `name`:
+
+    id,name,latitude,longitude
+    1,,10.7769,106.7009
+    ,Sân bóng đá 2,10.7296,106.7218
+
+Chạy: python import_coordinates.py coordinates.csv
+Các API danh mục sân đang chạy sẽ thấy tọa độ mới sau khi cache hết hạn
+(CATALOG_CACHE_TTL_SECONDS).
+"""
+import csv
+import sys
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from migrations import run_migrations
+from models import Facility
+
+def parse_coordinates(row: dict):
+    latitude = float(row["latitude"])
+    longitude = float(row["longitude"])
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("tọa độ ngoài phạm vi")
+    return latitude, longitude
+
+def import_coordinates(db: Session, path: str):
+    updated, skipped = 0, 0
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                latitude, longitude = parse_coordinates(row)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"⚠️ Dòng {line_no}: bỏ qua ({e})")
+                skipped += 1
+                continue
+
+            query = db.query(Facility)
+            if (row.get("id") or "").strip():
+                query = query.filter(Facility.id == int(row["id"]))
+            elif (row.get("name") or "").strip():
+                query = query.filter(Facility.name == row["name"].strip())
+            else:
+                print(f"⚠️ Dòng {line_no}: thiếu id hoặc name")
+                skipped += 1
+                continue
+
+            count = query.update(
+                {Facility.latitude: latitude, Facility.longitude: longitude},
+                synchronize_session=False,
+            )
+            if count == 0:
+                print(f"⚠️ Dòng {line_no}: không tìm thấy sân")
+                skipped += 1
+            updated += count
+
+    db.commit()
+    print(f"✅ Đã cập nhật tọa độ cho {updated} sân, bỏ qua {skipped} dòng")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Cách dùng: python import_coordinates.py <file.csv>")
+        sys.exit(1)
+
+    run_migrations()
+    db: Session = SessionLocal()
+    try:
+        import_coordinates(db, sys.argv[1])
+    finally:
+        db.close()
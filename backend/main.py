@@ -1,9 +1,11 @@
 from uuid import uuid4
 from fastapi import FastAPI, Depends, Form, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
-from database import get_db, engine
+from database import get_db, get_async_db, engine
 from models import *
 from schemas import *
 from typing import List
@@ -13,7 +15,7 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from routes import facilities, notifications, auth, booking, me, admin, messages
-from auth import get_current_user
+from auth import get_current_user, get_current_principal, get_admin_user, Principal
 import json
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
@@ -22,11 +24,24 @@ import os
 from dotenv import load_dotenv
 from payos import PayOS, ItemData, PaymentData
 import asyncio
-from fastapi.staticfiles import StaticFiles
-from utils import save_file
+from services.static_files import UploadStaticFiles
+from utils import UPLOAD_DIR, UPLOAD_TMP_DIR, save_files
+from migrations import run_migrations
+from services.jobs import run_job, run_daily
+from services.booking_stats import backfill_booking_stats, reconcile_recent_booking_stats
+from services.notification_retention import run_notification_retention
+from services.chat import chat_writer, receiver_cache
+from services.broker import broker
+from services.connection_manager import ConnectionManager, manager
+from services.images import shutdown_image_pool
+from services.mailer import email_outbox
+from services.notification import notification_sink
+from services.passwords import shutdown_password_pool
+from services.storage import acquire_files, purge_unreferenced_files
 
 # Create tables
 Base.metadata.create_all(bind=engine, checkfirst=True)
+run_migrations()
 
 app = FastAPI(title="Sports Facility Auth API")
 
@@ -42,6 +57,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.add_middleware(SessionMiddleware, secret_key="my-secret-key-123")
@@ -70,6 +86,11 @@ app.include_router(payment.router)
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
+# Số socket đang kết nối, độ sâu hàng đợi gửi và số lần gửi bị bỏ trên worker này (chỉ admin)
+@app.get("/api/metrics/websockets")
+async def websocket_metrics(admin: Principal = Depends(get_admin_user)):
+    return [m.metrics() for m in ConnectionManager.instances]
+
 # JWT config
 SECRET_KEY = "my-secret-key-123"
 ALGORITHM = "HS256"
@@ -81,7 +102,7 @@ def root():
 @app.get("/api/messages/all-chatted", response_model=List[UserOut])
 def get_users_talked_to(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     # Lấy tất cả message liên quan đến current_user
     messages = db.query(Message).filter(
@@ -118,11 +139,10 @@ def get_user_by_id(user_id: int, db: Session = Depends(get_db)):
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
-UPLOAD_DIR = "uploads"
-
 # Tạo folder nếu chưa tồn tại
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+app.mount("/uploads", UploadStaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 @app.post("/request-host-upgrade")
 async def request_host_upgrade(
@@ -138,22 +158,24 @@ async def request_host_upgrade(
     business_license: list[UploadFile] = Form(...),  # file field
     facility_images: list[UploadFile] = Form(...),
     
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:        
         # Kiểm tra nếu user đã có request pending
-        existing = db.query(UserUpgradeRequest).filter_by(
-            user_id=current_user.id, status="pending"
-        ).first()
+        existing = (await db.execute(
+            select(UserUpgradeRequest.id).filter_by(user_id=current_user.id, status="pending")
+        )).first()
         if existing:
             raise HTTPException(status_code=400, detail="Bạn đã gửi yêu cầu trước đó")
 
-        # Lưu file và lấy đường dẫn
-        cccd_front_path = [await save_file(file) for file in cccd_front]
-        cccd_back_path = [await save_file(file) for file in cccd_back]
-        business_license_file_path = [await save_file(file) for file in business_license]
-        facility_images_path = [await save_file(file) for file in facility_images]
+        # Lưu đồng thời tất cả file (giới hạn dung lượng chung cho cả request)
+        saved = [u.path for u in await save_files(cccd_front + cccd_back + business_license + facility_images)]
+        paths = iter(saved)
+        cccd_front_path = [next(paths) for _ in cccd_front]
+        cccd_back_path = [next(paths) for _ in cccd_back]
+        business_license_file_path = [next(paths) for _ in business_license]
+        facility_images_path = [next(paths) for _ in facility_images]
 
         # Tạo bản ghi mới
         upgrade_request = UserUpgradeRequest(
@@ -173,11 +195,13 @@ async def request_host_upgrade(
         )
 
         db.add(upgrade_request)
-        db.commit()
-        db.refresh(upgrade_request)
+        await acquire_files(db, saved)
+        await db.commit()
 
         return {"detail": "Yêu cầu nâng cấp đã gửi thành công", "request_id": upgrade_request.id}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in request_host_upgrade: {str(e)}")
         import traceback
@@ -185,20 +209,52 @@ async def request_host_upgrade(
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # ws://localhost:8000/chat?token=<token>
-active_connections: dict[int, WebSocket] = {}
+# Gửi qua connection manager (broker) để tới được user kết nối ở worker khác
+async def send_to_user(user_id: int, payload: dict):
+    try:
+        await manager.send_personal_message(payload, user_id)
+    except Exception as e:
+        print(f"❌ Chat delivery error to user {user_id}: {e}")
+
+async def confirm_saved_message(saved, sender_id: int, receiver_id: int, temp_id: str, content: str):
+    """Chờ tin nhắn được ghi vào DB rồi gửi id thật cho người gửi và người nhận."""
+    try:
+        message_id, created_at = await saved
+    except Exception:
+        await send_to_user(sender_id, {"error": "Không lưu được tin nhắn", "temp_id": temp_id})
+        return
+
+    # Người gửi: thay tin nhắn tạm (temp_id) bằng tin nhắn đã lưu
+    await send_to_user(sender_id, {
+        "id": message_id,
+        "temp_id": temp_id,
+        "from": sender_id,
+        "to": receiver_id,
+        "message": content,
+        "created_at": created_at.isoformat()
+    })
+    # Người nhận: cập nhật id thật cho tin nhắn đã nhận trước đó
+    await send_to_user(receiver_id, {
+        "type": "message_saved",
+        "temp_id": temp_id,
+        "id": message_id,
+        "from": sender_id,
+        "to": receiver_id,
+        "created_at": created_at.isoformat()
+    })
 
 @app.websocket("/api/messages/chat")
-async def websocket_endpoint(websocket: WebSocket, token: str = Query(...), db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
     try:
         user = decode_token(token)
         user_id = user["id"]
-        await websocket.accept()
-        active_connections[user_id] = websocket
+        await manager.connect(user_id, websocket)
 
     except Exception as e:
         await websocket.close(code=1008)
         return
 
+    pending_confirmations = set()
     try:
         while True:
             data = await websocket.receive_json()
@@ -217,52 +273,36 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...), db:
             if not content:
                 continue
             
-            # Kiểm tra receiver tồn tại
-            receiver = db.query(User).filter(User.id == receiver_id).first()
-            if not receiver:
+            # Kiểm tra receiver tồn tại (có cache, không query DB cho mỗi tin nhắn)
+            if not await receiver_cache.exists(receiver_id):
                 await websocket.send_json({"error": "Receiver not found"})
                 continue
 
-            # Lưu vào DB
-            msg = Message(sender_id=user_id, receiver_id=receiver_id, content=content)
-            db.add(msg)
-            db.commit()
-            db.refresh(msg)
+            # Đưa vào hàng đợi ghi DB (batch insert), không chờ ghi xong
+            temp_id = data.get("temp_id") or f"temp_{uuid4().hex}"
+            saved = await chat_writer.save(user_id, receiver_id, content)
 
-            # Gửi cho cả sender và receiver
-            message_data = {
-                "id": msg.id,
-                "temp_id": data.get("temp_id"),
+            # Gửi ngay cho người nhận với id tạm; id thật được gửi bổ sung sau khi lưu
+            await send_to_user(receiver_id, {
+                "id": temp_id,
+                "temp_id": temp_id,
                 "from": user_id,
                 "to": receiver_id,
                 "message": content,
-                "created_at": msg.created_at.isoformat()
-            }
-
-            # 1. Gửi cho người nhận
-            if receiver_id in active_connections:
-                try:
-                    await active_connections[receiver_id].send_json(message_data)
-                except:
-                    active_connections.pop(receiver_id, None)
-            
-            # 2. Gửi confirmation lại cho người gửi
-            try:
-                await websocket.send_json({
-                    "id": msg.id,
-                    "from": user_id,
-                    "to": receiver_id,
-                    "message": content,
-                    "created_at": msg.created_at.isoformat()
-                })
-            except:
-                pass
+                "created_at": datetime.utcnow().isoformat()
+            })
+
+            task = asyncio.create_task(
+                confirm_saved_message(saved, user_id, receiver_id, temp_id, content)
+            )
+            pending_confirmations.add(task)
+            task.add_done_callback(pending_confirmations.discard)
                     
     except WebSocketDisconnect:
-        active_connections.pop(user_id, None)
+        manager.disconnect(user_id, websocket)
     except Exception as e:
         print(f"WebSocket error: {e}")
-        active_connections.pop(user_id, None)
+        manager.disconnect(user_id, websocket)
 
 def decode_token(token: str):
     try:
@@ -294,4 +334,27 @@ async def confirm_webhook_task():
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(confirm_webhook_task())
\ No newline at end of file
+    await broker.start()
+    chat_writer.start()
+    email_outbox.start()
+    notification_sink.start()
+    asyncio.create_task(confirm_webhook_task())
+    asyncio.create_task(run_job(backfill_booking_stats))
+    # Đối soát bảng thống kê booking mỗi đêm
+    asyncio.create_task(run_daily(reconcile_recent_booking_stats, hour=3))
+    # Dọn notification đã đọc quá hạn và gộp notification đăng nhập
+    asyncio.create_task(run_daily(run_notification_retention, hour=4))
+    # Xóa file upload không còn được sân/yêu cầu nào dùng
+    asyncio.create_task(run_daily(purge_unreferenced_files, hour=5))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Ghi nốt các tin nhắn còn trong hàng đợi
+    await chat_writer.stop()
+    # Gửi nốt email reset password còn trong hàng đợi
+    await email_outbox.stop()
+    # Ghi nốt notification đăng nhập/kết quả duyệt còn trong bộ đệm
+    await notification_sink.stop()
+    await broker.stop()
+    shutdown_image_pool()
+    shutdown_password_pool()
@@ -0,0 +1,101 @@
+# Các thay đổi schema chạy lại an toàn (idempotent) mỗi lần khởi động.
+# Base.metadata.create_all chỉ tạo bảng còn thiếu, không thêm index/cột/constraint
+# mới vào bảng đã tồn tại, nên mọi thay đổi như vậy được khai báo ở đây theo thứ tự.
+from sqlalchemy import text
+from database import engine
+from models import FACILITY_SEARCH_DOCUMENT
+
+MIGRATIONS = [
+    # Tra cứu lịch đặt theo sân/court/ngày (availability index)
+    "CREATE INDEX IF NOT EXISTS ix_bookings_facility_court_start "
+    "ON bookings (facility_id, court_id, start_time)",
+
+    # Chống đặt trùng giờ ở mức database: hai booking chưa hủy của cùng một court
+    # không được có khoảng thời gian giao nhau (start_time/end_time là timestamp
+    # không timezone nên dùng tsrange). Court đánh số riêng theo từng môn nên
+    # sport_type là một phần của khóa; constraint cũ chỉ theo court_id được thay thế.
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    # Chỉ ALTER khi thật sự cần: ALTER TABLE lấy khóa ACCESS EXCLUSIVE trên bookings
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'bookings_no_overlap') THEN
+            ALTER TABLE bookings DROP CONSTRAINT bookings_no_overlap;
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'bookings_court_no_overlap') THEN
+            ALTER TABLE bookings ADD CONSTRAINT bookings_court_no_overlap
+            EXCLUDE USING gist (
+                facility_id WITH =,
+                (coalesce(sport_type, '')) WITH =,
+                court_id WITH =,
+                tsrange(start_time, end_time) WITH &&
+            ) WHERE (status <> 'cancelled');
+        END IF;
+    EXCEPTION WHEN exclusion_violation THEN
+        RAISE WARNING 'Không tạo được bookings_court_no_overlap: dữ liệu hiện có đang có booking trùng giờ';
+    END $$
+    """,
+
+    # Đếm notification chưa đọc (/api/notifications/unread-count)
+    "CREATE INDEX IF NOT EXISTS ix_notifications_user_unread "
+    "ON notifications (user_id) WHERE read = false",
+
+    # Độ ưu tiên dạng số nhỏ để index được thứ tự sắp xếp notification
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'notifications' AND column_name = 'priority_rank'
+        ) THEN
+            ALTER TABLE notifications ADD COLUMN priority_rank SMALLINT;
+            UPDATE notifications SET priority_rank = CASE priority
+                WHEN 'high' THEN 1 WHEN 'medium' THEN 2 WHEN 'low' THEN 3 ELSE 4 END;
+            ALTER TABLE notifications ALTER COLUMN priority_rank SET NOT NULL;
+        END IF;
+    END $$
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_notifications_user_feed "
+    "ON notifications (user_id, read, priority_rank, timestamp DESC, id DESC)",
+
+    # Job dọn notification đã đọc quá hạn
+    "CREATE INDEX IF NOT EXISTS ix_notifications_read_timestamp "
+    "ON notifications (timestamp) WHERE read = true",
+
+    # Tìm kiếm sân: lọc mảng sport_type/amenities và full-text không dấu
+    "CREATE INDEX IF NOT EXISTS ix_facilities_sport_type ON facilities USING gin (sport_type)",
+    "CREATE INDEX IF NOT EXISTS ix_facilities_amenities ON facilities USING gin (amenities)",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() không IMMUTABLE nên không dùng trực tiếp trong index được
+    # Chỉ tạo khi chưa có: CREATE OR REPLACE ở nhiều worker cùng lúc có thể lỗi
+    # "tuple concurrently updated"
+    """
+    DO $do$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_proc WHERE proname = 'f_unaccent') THEN
+            CREATE FUNCTION f_unaccent(text) RETURNS text AS
+            $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+        END IF;
+    END $do$
+    """,
+    f"CREATE INDEX IF NOT EXISTS ix_facilities_search ON facilities USING gin (({FACILITY_SEARCH_DOCUMENT}))",
+
+    # Tìm sân gần (/api/facilities/nearby): tọa độ + index GiST của earthdistance.
+    # Query lọc bằng earth_box(...) @> ll_to_earth(latitude, longitude) nên dùng được index này
+    "ALTER TABLE facilities ADD COLUMN IF NOT EXISTS latitude double precision",
+    "ALTER TABLE facilities ADD COLUMN IF NOT EXISTS longitude double precision",
+    "CREATE EXTENSION IF NOT EXISTS cube",
+    "CREATE EXTENSION IF NOT EXISTS earthdistance",
+    "CREATE INDEX IF NOT EXISTS ix_facilities_earth "
+    "ON facilities USING gist (ll_to_earth(latitude, longitude))",
+]
+
+# Khóa advisory cho migration: các worker khởi động cùng lúc chạy lần lượt
+MIGRATIONS_LOCK_ID = 72_001
+
+def run_migrations(bind=engine):
+    with bind.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATIONS_LOCK_ID})
+        for statement in MIGRATIONS:
+            conn.execute(text(statement))
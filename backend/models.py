@@ -1,5 +1,5 @@
 from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy import Table, Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float, JSON
+from sqlalchemy import Table, Column, Integer, SmallInteger, String, DateTime, Date, Boolean, Text, ForeignKey, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -81,6 +81,8 @@ class Facility(Base):
     cover_image = Column(Text, nullable=True)       # ảnh đại diện
     status = Column(String, default="active")     # active, inactive, maintenance
     location = Column(String)                     # thêm địa chỉ
+    latitude = Column(Float, nullable=True)       # tọa độ (độ), dùng cho tìm sân gần
+    longitude = Column(Float, nullable=True)
     rating = Column(Float, default=0.0)           # điểm trung bình
     reviews_count = Column(Integer, default=0)    # số review
     amenities = Column(ARRAY(String))             # mảng tiện ích (Postgres hỗ trợ ARRAY)
@@ -96,6 +98,19 @@ class Facility(Base):
     owner = relationship("User", foreign_keys=[owner_id])
     liked_by = relationship("UserFavorite", back_populates="facility", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Lọc theo môn/tiện ích bằng toán tử mảng (@>, &&)
+        Index("ix_facilities_sport_type", "sport_type", postgresql_using="gin"),
+        Index("ix_facilities_amenities", "amenities", postgresql_using="gin"),
+    )
+
+# Văn bản tìm kiếm full-text của sân (bỏ dấu tiếng Việt). Dùng chung cho
+# index ix_facilities_search (migrations.py) và query, hai biểu thức phải giống hệt nhau
+FACILITY_SEARCH_DOCUMENT = (
+    "to_tsvector('simple'::regconfig, f_unaccent("
+    "coalesce(name, '') || ' ' || coalesce(description, '') || ' ' || coalesce(location, '')))"
+)
+
 class UserFavorite(Base):
     __tablename__ = "user_favorites"
 
@@ -128,7 +143,53 @@ class Booking(Base):
     # Relationships
     user = relationship("User", back_populates="bookings")
     facility = relationship("Facility", back_populates="bookings")
+
+    __table_args__ = (
+        Index("ix_bookings_facility_court_start", "facility_id", "court_id", "start_time"),
+    )
+
+class BookingDailyStat(Base):
+    """Số booking (chưa hủy) và doanh thu theo sân và ngày tạo booking."""
+    __tablename__ = "booking_daily_stats"
+
+    facility_id = Column(Integer, ForeignKey("facilities.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+    bookings_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+class StoredFile(Base):
+    """File upload lưu theo nội dung (key = sha256 + đuôi file), đếm số nơi đang dùng."""
+    __tablename__ = "stored_files"
+
+    key = Column(String, primary_key=True)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Cập nhật mỗi lần có upload trùng nội dung; job dọn file chỉ xóa file
+    # ref_count = 0 đã lâu không được upload lại
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class PaymentOrder(Base):
+    """Trạng thái một đơn thanh toán PayOS, dùng chung cho mọi worker."""
+    __tablename__ = "payment_orders"
+
+    order_code = Column(String, primary_key=True)
+    status = Column(String, nullable=False, default="pending")  # pending, success, failed
+    amount = Column(Integer)
+    message = Column(String)
+    booking_id = Column(Integer, ForeignKey("bookings.id", ondelete="SET NULL"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+# Thứ tự ưu tiên khi liệt kê notification: high -> medium -> low -> khác
+NOTIFICATION_PRIORITY_RANKS = {"high": 1, "medium": 2, "low": 3}
+NOTIFICATION_DEFAULT_RANK = 4
+
+def _notification_priority_rank(context):
+    priority = context.get_current_parameters().get("priority") or "medium"
+    return NOTIFICATION_PRIORITY_RANKS.get(priority, NOTIFICATION_DEFAULT_RANK)
+
 class Notification(Base):
     __tablename__ = "notifications"
 
@@ -144,11 +205,21 @@ class Notification(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     read = Column(Boolean, default=False)
     priority = Column(String, default="medium")   # low, medium, high
+    priority_rank = Column(SmallInteger, nullable=False, default=_notification_priority_rank)  # số để sắp xếp/index
 
     # Dữ liệu bổ sung (vd: booking_id, payment_id)
     data = Column(JSON)
 
     user = relationship("User", back_populates="notifications")
+
+    __table_args__ = (
+        # Đếm notification chưa đọc của user
+        Index("ix_notifications_user_unread", "user_id", postgresql_where=(read == False)),
+        # Khớp đúng thứ tự sắp xếp của GET /api/notifications/ (keyset pagination)
+        Index("ix_notifications_user_feed", "user_id", "read", "priority_rank", timestamp.desc(), id.desc()),
+        # Job dọn notification đã đọc quá hạn
+        Index("ix_notifications_read_timestamp", "timestamp", postgresql_where=(read == True)),
+    )
       
 class Staff(Base):
     __tablename__ = "staffs"
@@ -1,16 +1,16 @@
 from pydantic import BaseModel
-from auth import get_admin_user
+from auth import get_admin_user, invalidate_principal, Principal
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from database import get_db
 from models import *
 from datetime import datetime, date
-from services.notification import create_notification
+from services.notification import notification_sink
 
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
 
 @router.get("/upgrade-requests")
-def list_upgrade_requests(db: Session = Depends(get_db), admin: User = Depends(get_admin_user)):
+def list_upgrade_requests(db: Session = Depends(get_db), admin: Principal = Depends(get_admin_user)):
     requests = (
         db.query(UserUpgradeRequest, User)
         .join(User, User.id == UserUpgradeRequest.user_id)
@@ -52,7 +52,7 @@ def list_upgrade_requests(db: Session = Depends(get_db), admin: User = Depends(g
 def approve_upgrade_request(
     request_id: int,
     db: Session = Depends(get_db),
-    admin: User = Depends(get_admin_user)
+    admin: Principal = Depends(get_admin_user)
 ):
     req = db.get(UserUpgradeRequest, request_id)
     if not req or req.status != "pending":
@@ -66,16 +66,6 @@ def approve_upgrade_request(
         user.role = "host"
         req.status = "approved"
         
-        create_notification(
-            db=db,
-            user_id=user.id,
-            type="system",
-            title="Kết quả đơn nâng cấp role",
-            message=f"Tài khoản {user.username} được duyệt thành chủ sân",
-            priority="high",
-            data={}
-        )
-
         db.commit()
         db.refresh(user)
         db.refresh(req)
@@ -83,6 +73,17 @@ def approve_upgrade_request(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Lỗi khi approve: {str(e)}")
 
+    # Role đổi: bỏ principal đang cache ở mọi worker
+    invalidate_principal(user.id)
+    notification_sink.emit(
+        user_id=user.id,
+        type="system",
+        title="Kết quả đơn nâng cấp role",
+        message=f"Tài khoản {user.username} được duyệt thành chủ sân",
+        priority="high",
+        data={}
+    )
+
     return {
         "detail": "Đã phê duyệt",
         "user": {"id": user.id, "username": user.username, "role": user.role},
@@ -97,7 +98,7 @@ def reject_upgrade_request(
     request_id: int,
     body: RejectRequestBody,
     db: Session = Depends(get_db),
-    admin: User = Depends(get_admin_user)
+    admin: Principal = Depends(get_admin_user)
 ):
     req = db.get(UserUpgradeRequest, request_id)
     if not req or req.status != "pending":
@@ -111,8 +112,10 @@ def reject_upgrade_request(
     if not user:
         raise HTTPException(status_code=404, detail="User không tồn tại")
 
-    create_notification(
-        db=db,
+    db.commit()
+    db.refresh(req)
+
+    notification_sink.emit(
         user_id=user.id,
         type="system",
         title="Kết quả đơn nâng cấp role",
@@ -121,18 +124,38 @@ def reject_upgrade_request(
         data={}
     )
 
+    return {"detail": "Đã từ chối", "request": {"id": req.id, "status": req.status, "reason": req.rejection_reason}}
+
+class UserActiveBody(BaseModel):
+    is_active: bool
+
+@router.patch("/users/{user_id}/active")
+def set_user_active(
+    user_id: int,
+    body: UserActiveBody,
+    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_admin_user)
+):
+    user = db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User không tồn tại")
+    if user.id == admin.id and not body.is_active:
+        raise HTTPException(status_code=400, detail="Không thể tự khóa tài khoản của mình")
+
+    user.is_active = body.is_active
     db.commit()
-    db.refresh(req)
+    # Token cũ của user bị khóa hết hiệu lực ngay, không phải chờ hết TTL cache
+    invalidate_principal(user.id)
 
-    return {"detail": "Đã từ chối", "request": {"id": req.id, "status": req.status, "reason": req.rejection_reason}}
+    return {"id": user.id, "is_active": user.is_active}
 
 @router.get("/stats")
 def get_admin_stats(db: Session = Depends(get_db)):
-    total_revenue = 0
+    total_revenue = db.query(func.coalesce(func.sum(BookingDailyStat.revenue), 0)).scalar()
     total_users = db.query(func.count(User.id)).scalar()
     total_facilities = db.query(func.count(Facility.id)).scalar()
-    today_bookings = db.query(func.count(Booking.id)).filter(
-        func.date(Booking.created_at) == date.today()
+    today_bookings = db.query(func.coalesce(func.sum(BookingDailyStat.bookings_count), 0)).filter(
+        BookingDailyStat.day == date.today()
     ).scalar()
 
     return {
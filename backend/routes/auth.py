@@ -1,7 +1,8 @@
 import os
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import User
 from schemas import (
     LoginRequest, UserCreate, ChangePasswordRequest,
@@ -9,14 +10,14 @@ from schemas import (
 )
 
 from auth import (
-    verify_password, hash_password,
-    create_access_token, verify_token,
-    oauth2_scheme, create_reset_token, verify_reset_token, get_current_user_id
+    create_access_token, create_reset_token, verify_reset_token,
+    get_current_user, get_current_user_id
 )
 
-from auth import send_reset_password_email
+from services.mailer import send_reset_password_email
 from datetime import datetime, timedelta
-from services.notification import create_notification
+from services.notification import notification_sink, LOGIN_NOTIFICATION_TITLE
+from services.passwords import hash_password_async, verify_password_async
 from fastapi import Request
 from authlib.integrations.starlette_client import OAuth
 from fastapi.responses import RedirectResponse
@@ -24,20 +25,27 @@ from fastapi.responses import RedirectResponse
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
 @router.post("/login")
-def login(request: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == request.username).first()
-    if not user or not verify_password(request.password, user.hashed_password):
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).where(User.username == request.username))).scalar_one_or_none()
+    if not user:
+        raise HTTPException(status_code=401, detail="Sai tài khoản hoặc mật khẩu")
+    valid, new_hash = await verify_password_async(request.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Sai tài khoản hoặc mật khẩu")
+    # Hash cũ dùng cost khác BCRYPT_ROUNDS: lưu hash mới
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
 
     access_token = create_access_token(
         data={"sub": user.username, "role": user.role, "id": user.id}
     )
-    
-    create_notification(
-        db=db,
+
+    # Ghi ở nền theo batch, không chờ INSERT trước khi trả token
+    notification_sink.emit(
         user_id=user.id,
         type="system",
-        title="Đăng nhập thành công",
+        title=LOGIN_NOTIFICATION_TITLE,
         message=f"Tài khoản {user.username} vừa đăng nhập vào hệ thống",
         priority="low",
         data={}
@@ -55,15 +63,7 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
     }
 
 @router.get("/me")
-def get_me(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-
-    user = db.query(User).filter(User.id == payload["id"]).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Không tìm thấy user")
-
+def get_me(user: User = Depends(get_current_user)):
     return {
         "id": user.id,
         "username": user.username,
@@ -81,31 +81,28 @@ def get_me(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     }
 
 @router.post("/change-password")
-def change_password(
+async def change_password(
     data: ChangePasswordRequest,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-
-    user = db.query(User).filter(User.id == payload["id"]).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User không tồn tại")
 
-    if not verify_password(data.old_password, user.hashed_password):
+    valid, _ = await verify_password_async(data.old_password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=400, detail="Mật khẩu cũ không đúng")
 
-    user.hashed_password = hash_password(data.new_password)
-    db.commit()
+    user.hashed_password = await hash_password_async(data.new_password)
+    await db.commit()
     return {"message": "Đổi mật khẩu thành công!"}
 
 @router.post("/register")
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(
-        (User.username == user_data.username) | (User.email == user_data.email)
-    ).first()
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = (await db.execute(
+        select(User.id).where((User.username == user_data.username) | (User.email == user_data.email))
+    )).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Username hoặc Email đã tồn tại")
 
@@ -113,7 +110,7 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         username=user_data.username,
         email=user_data.email,
         full_name=user_data.full_name,
-        hashed_password=hash_password(user_data.password),
+        hashed_password=await hash_password_async(user_data.password),
         role="user",
         is_active=True,
         total_bookings=0,
@@ -121,17 +118,16 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         member_level="Bronze"
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return {"message": "Đăng ký thành công!", "user_id": new_user.id}
 
 @router.post("/forgot-password")
 async def forgot_password(
     request: ForgotPasswordRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.email == request.email).first()
+    user = (await db.execute(select(User).where(User.email == request.email))).scalar_one_or_none()
     if not user:
         return {"message": "Nếu email tồn tại trong hệ thống, bạn sẽ nhận được email reset."}
 
@@ -140,38 +136,34 @@ async def forgot_password(
         expires_minutes=15
     )
 
-    background_tasks.add_task(
-        send_reset_password_email,
-        request.email,
-        reset_token,
-        getattr(user, 'name', None)
-    )
+    # Chỉ đưa vào hàng đợi; email được gửi bởi email_outbox ở nền
+    send_reset_password_email(request.email, reset_token, getattr(user, 'name', None))
     return {"message": "Nếu email tồn tại trong hệ thống, bạn sẽ nhận được email reset."}
 
 @router.get("/verify-reset-token/{token}")
-async def verify_reset_token_endpoint(token: str, db: Session = Depends(get_db)):
+async def verify_reset_token_endpoint(token: str, db: AsyncSession = Depends(get_async_db)):
     payload = verify_reset_token(token)
     if not payload or payload.get("purpose") != "password_reset":
         raise HTTPException(status_code=400, detail="Token không hợp lệ hoặc đã hết hạn")
 
-    user = db.query(User).filter(User.id == payload["id"]).first()
+    user = await db.get(User, payload["id"])
     if not user:
         raise HTTPException(status_code=400, detail="User không tồn tại")
 
     return {"valid": True, "message": "Token hợp lệ", "user_id": payload["id"]}
 
 @router.post("/reset-password")
-async def reset_password(request: ResetPasswordRequest, db: Session = Depends(get_db)):
+async def reset_password(request: ResetPasswordRequest, db: AsyncSession = Depends(get_async_db)):
     payload = verify_reset_token(request.token)
     if not payload or payload.get("purpose") != "password_reset":
         raise HTTPException(status_code=400, detail="Token không hợp lệ hoặc đã hết hạn")
 
-    user = db.query(User).filter(User.id == payload["id"]).first()
+    user = await db.get(User, payload["id"])
     if not user:
         raise HTTPException(status_code=404, detail="User không tồn tại")
 
-    user.hashed_password = hash_password(request.new_password)
-    db.commit()
+    user.hashed_password = await hash_password_async(request.new_password)
+    await db.commit()
     return {"message": "Đặt lại mật khẩu thành công!"}
 
 # login with google
@@ -202,7 +194,7 @@ FRONTEND_URL = "http://localhost:3000"
 @router.get("/google/callback", name="google_callback")
 async def google_callback(
     request: Request, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     token = await oauth.google.authorize_access_token(request)
     user_data = token.get("userinfo")
@@ -211,7 +203,7 @@ async def google_callback(
         raise HTTPException(status_code=400, detail="Google login failed")
 
     # Tìm user trong DB
-    db_user = db.query(User).filter(User.email == user_data["email"]).first()
+    db_user = (await db.execute(select(User).where(User.email == user_data["email"]))).scalar_one_or_none()
 
     # Nếu chưa có thì tạo mới
     if not db_user:
@@ -225,8 +217,8 @@ async def google_callback(
             avatar=user_data.get("picture")
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
 
     # Tạo JWT access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
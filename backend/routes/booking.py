@@ -1,27 +1,29 @@
+from datetime import date as date_type
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from database import get_db
 from models import Booking, Facility
 from schemas import BookingCreate
-from auth import oauth2_scheme, verify_token
+from auth import get_current_user_id
+from services.availability import availability_index, RELEASED_STATUSES
+from services.booking_stats import record_booking_created, record_booking_status_change
 
 router = APIRouter(
     prefix="/api/bookings",
     tags=["Bookings"]
 )
 
+# SQLSTATE của exclusion_violation (constraint bookings_court_no_overlap)
+EXCLUSION_VIOLATION = "23P01"
+
 @router.get("/")
 def get_bookings(
-    token: str = Depends(oauth2_scheme),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-
-    user_id = payload["id"]
     bookings = db.query(Booking).filter(Booking.user_id == user_id).all()
     return [
         {
@@ -47,20 +49,24 @@ def get_bookings(
 @router.post("/")
 def create_booking(
     booking_data: BookingCreate,
-    token: str = Depends(oauth2_scheme),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-    
-    user_id = payload["id"]
-
     # Kiểm tra facility có tồn tại không
     facility = db.query(Facility).filter(Facility.id == booking_data.facility_id).first()
     if not facility:
         raise HTTPException(status_code=404, detail="Không tìm thấy sân")
 
+    if booking_data.end_time <= booking_data.start_time:
+        raise HTTPException(status_code=400, detail="Giờ kết thúc phải sau giờ bắt đầu")
+
+    # Kiểm tra khung giờ còn trống trên court
+    if not availability_index.is_free(
+        db, booking_data.facility_id, booking_data.sport_type, booking_data.court_id,
+        booking_data.start_time, booking_data.end_time
+    ):
+        raise HTTPException(status_code=409, detail="Khung giờ này đã có người đặt")
+
     # Tạo booking mới
     new_booking = Booking(
         user_id=user_id,
@@ -77,9 +83,23 @@ def create_booking(
         notes=booking_data.notes or f"Đặt sân {', '.join(booking_data.time_slots)}"
     )
 
+    # Constraint bookings_court_no_overlap đảm bảo chỉ một request thắng khi nhiều
+    # người cùng đặt một khung giờ; các request còn lại nhận 409
     db.add(new_booking)
-    db.commit()
+    record_booking_created(db, new_booking)
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if getattr(e.orig, "pgcode", None) != EXCLUSION_VIOLATION:
+            raise
+        availability_index.forget(
+            booking_data.facility_id, booking_data.sport_type, booking_data.court_id,
+            booking_data.start_time, booking_data.end_time
+        )
+        raise HTTPException(status_code=409, detail="Khung giờ này đã có người đặt")
     db.refresh(new_booking)
+    availability_index.reserve(new_booking)
 
     return {
         "message": "Đặt sân thành công!",
@@ -91,6 +111,52 @@ def create_booking(
     }
 from fastapi import Query
 
+@router.get("/availability")
+def get_availability(
+    facility_id: int = Query(..., description="ID sân"),
+    sport_type: Optional[str] = Query(None, description="Môn thể thao của court"),
+    court_id: int = Query(..., description="ID court"),
+    date: date_type = Query(..., description="Ngày (YYYY-MM-DD)"),
+    db: Session = Depends(get_db)
+):
+    facility = db.query(Facility.opening_hours).filter(Facility.id == facility_id).first()
+    if not facility:
+        raise HTTPException(status_code=404, detail="Không tìm thấy sân")
+
+    return {
+        "facility_id": facility_id,
+        "sport_type": sport_type,
+        "court_id": court_id,
+        "date": date.isoformat(),
+        "opening_hours": facility.opening_hours,
+        "free_slots": availability_index.free_slots(
+            db, facility_id, sport_type, court_id, date, facility.opening_hours
+        )
+    }
+
+@router.patch("/{booking_id}/cancel")
+def cancel_booking(
+    booking_id: int,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    booking = db.query(Booking).filter(
+        Booking.id == booking_id,
+        Booking.user_id == user_id
+    ).first()
+    if not booking:
+        raise HTTPException(status_code=404, detail="Không tìm thấy booking")
+    if booking.status in RELEASED_STATUSES:
+        raise HTTPException(status_code=400, detail="Booking đã bị hủy trước đó")
+
+    old_status = booking.status
+    booking.status = "cancelled"
+    record_booking_status_change(db, booking, old_status)
+    db.commit()
+    availability_index.release(booking)
+
+    return {"message": "Hủy đặt sân thành công", "booking_id": booking.id, "status": booking.status}
+
 @router.get("/search")
 def search_bookings(
     facility_id: int = Query(..., description="ID sân"),
@@ -126,15 +192,9 @@ def search_bookings(
     
 @router.get("/owner")
 def get_bookings_for_host(
-    token: str = Depends(oauth2_scheme),
+    owner_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    # Xác minh token
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-
-    owner_id = payload["id"]  # host id
 
     # Join Booking với Facility để lọc theo owner_id
     bookings = (
@@ -1,15 +1,19 @@
-from datetime import datetime
-import os
-from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from database import get_db
-from models import Facility, UserFavorite, Booking, User
-from auth import verify_token, oauth2_scheme, get_current_user
+from datetime import date, datetime, time, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, UploadFile, File, Form
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, and_, select, tuple_, literal_column, text
+from database import get_db, get_async_db
+from models import Facility, UserFavorite, Booking, BookingDailyStat, FACILITY_SEARCH_DOCUMENT
+from auth import get_current_principal, get_current_user_id, Principal
 from typing import Annotated, List, Optional, Union, Dict
 from pydantic import BaseModel, Field, ConfigDict
 import json
-from utils import save_file
+from utils import save_files, encode_cursor, decode_cursor
+from services.cache import cached_json_response, catalog_cache
+from services.availability import availability_index, opening_window
+from services.images import image_variants, parse_images
+from services.storage import acquire_files, release_files
 
 router = APIRouter(prefix="/api/facilities", tags=["Facilities"])
 
@@ -36,6 +40,8 @@ class FacilityUpdate(BaseModel):
     description: Optional[str] = None
     price_per_hour: Optional[float] = None
     location: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     amenities: Optional[List[str]] = None
     opening_hours: Optional[str] = None
     court_layout: Optional[CourtLayout] = None
@@ -55,6 +61,16 @@ class FacilityStats(BaseModel):
 
 @router.get("/stats", response_model=list[FacilityStats])
 def get_facilities_stats(db: Session = Depends(get_db)):
+    # Đọc từ bảng rollup booking_daily_stats thay vì join toàn bộ bảng bookings
+    totals = (
+        db.query(
+            BookingDailyStat.facility_id,
+            func.sum(BookingDailyStat.bookings_count).label("bookings_count"),
+            func.sum(BookingDailyStat.revenue).label("revenue"),
+        )
+        .group_by(BookingDailyStat.facility_id)
+        .subquery()
+    )
     facilities = (
         db.query(
             Facility.id,
@@ -62,12 +78,11 @@ def get_facilities_stats(db: Session = Depends(get_db)):
             Facility.sport_type,
             Facility.price_per_hour,
             Facility.status,
-            func.count(Booking.id).label("bookings_count"),
-            func.coalesce(func.sum(Booking.total_price), 0).label("revenue"),
+            func.coalesce(totals.c.bookings_count, 0).label("bookings_count"),
+            func.coalesce(totals.c.revenue, 0).label("revenue"),
             Facility.owner_id
         )
-        .outerjoin(Booking, Facility.id == Booking.facility_id)
-        .group_by(Facility.id)
+        .outerjoin(totals, Facility.id == totals.c.facility_id)
         .all()
     )
     return facilities
@@ -75,50 +90,41 @@ def get_facilities_stats(db: Session = Depends(get_db)):
 @router.get("/host")
 def get_facilities_for_host(
     db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
+    owner_id: int = Depends(get_current_user_id)
 ):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-    owner_id = payload["id"]
-
-    today = datetime.today().date()
-    now = datetime.today()
-
-    facilities = db.query(Facility).filter(Facility.owner_id == owner_id).all()
-
-    result = []
-    for f in facilities:
-        bookings_today = (
-            db.query(func.count(Booking.id))
-            .filter(Booking.facility_id == f.id)
-            .filter(func.date(Booking.start_time) == today)
-            .scalar()
-        )
 
-        revenue_today = (
-            db.query(func.coalesce(func.sum(Booking.total_price), 0))
-            .filter(Booking.facility_id == f.id)
-            .filter(func.date(Booking.start_time) == today)
-            .scalar()
-        )
+    today_start = datetime.combine(date.today(), time.min)
+    tomorrow_start = today_start + timedelta(days=1)
+    month_start = today_start.replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
 
-        bookings_this_month = (
-            db.query(func.count(Booking.id))
-            .filter(Booking.facility_id == f.id)
-            .filter(extract("month", Booking.start_time) == now.month)
-            .filter(extract("year", Booking.start_time) == now.year)
-            .scalar()
+    # Một query duy nhất: LEFT JOIN các booking trong tháng rồi đếm/cộng có điều kiện
+    # (COUNT/SUM ... FILTER) thay vì 4 query cho mỗi sân. So sánh theo khoảng
+    # start_time để dùng được index thay vì func.date()/extract()
+    in_today = and_(Booking.start_time >= today_start, Booking.start_time < tomorrow_start)
+    rows = (
+        db.query(
+            Facility,
+            func.count(Booking.id).filter(in_today).label("bookings_today"),
+            func.coalesce(func.sum(Booking.total_price).filter(in_today), 0).label("revenue_today"),
+            func.count(Booking.id).label("bookings_this_month"),
+            func.coalesce(func.sum(Booking.total_price), 0).label("revenue_this_month"),
         )
-
-        revenue_this_month = (
-            db.query(func.coalesce(func.sum(Booking.total_price), 0))
-            .filter(Booking.facility_id == f.id)
-            .filter(extract("month", Booking.start_time) == now.month)
-            .filter(extract("year", Booking.start_time) == now.year)
-            .scalar()
+        .outerjoin(
+            Booking,
+            and_(
+                Booking.facility_id == Facility.id,
+                Booking.start_time >= month_start,
+                Booking.start_time < next_month_start,
+            )
         )
+        .filter(Facility.owner_id == owner_id)
+        .group_by(Facility.id)
+        .all()
+    )
 
+    result = []
+    for f, bookings_today, revenue_today, bookings_this_month, revenue_this_month in rows:
         result.append({
             "id": f.id,
             "name": f.name,
@@ -126,7 +132,10 @@ def get_facilities_for_host(
             "description": f.description,
             "price_per_hour": f.price_per_hour,
             "cover_image": f.cover_image,
+            "cover_image_variants": image_variants(f.cover_image),
             "location": f.location,
+            "latitude": f.latitude,
+            "longitude": f.longitude,
             "rating": f.rating,
             "reviews_count": f.reviews_count,
             "amenities": f.amenities,
@@ -142,7 +151,10 @@ def get_facilities_for_host(
     return result
 
 @router.get("/")
-def get_facilities(db: Session = Depends(get_db)):
+def get_facilities(request: Request, db: Session = Depends(get_db)):
+    return cached_json_response(request, "facilities:list", lambda: list_active_facilities(db))
+
+def list_active_facilities(db: Session):
     facilities = db.query(Facility).filter(Facility.is_active == True).all()
     return [
         {
@@ -153,7 +165,10 @@ def get_facilities(db: Session = Depends(get_db)):
             "description": f.description,
             "price_per_hour": f.price_per_hour,
             "cover_image": f.cover_image,
+            "cover_image_variants": image_variants(f.cover_image),
             "location": f.location,
+            "latitude": f.latitude,
+            "longitude": f.longitude,
             "rating": f.rating,
             "reviews_count": f.reviews_count,
             "amenities": f.amenities,
@@ -165,6 +180,263 @@ def get_facilities(db: Session = Depends(get_db)):
         for f in facilities
     ]
 
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# sort -> (biểu thức sắp xếp, tăng dần?)
+SEARCH_SORTS = {
+    "newest": (Facility.created_at, False),
+    "price_asc": (Facility.price_per_hour, True),
+    "price_desc": (Facility.price_per_hour, False),
+    "rating": (func.coalesce(Facility.rating, 0), False),
+}
+
+def split_csv(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+@router.get("/search")
+def search_facilities(
+    request: Request,
+    q: Optional[str] = Query(None, description="Tìm theo tên, mô tả, địa chỉ (không phân biệt dấu)"),
+    sport_type: Optional[str] = Query(None, description="Một hoặc nhiều môn, cách nhau bởi dấu phẩy"),
+    amenities: Optional[str] = Query(None, description="Các tiện ích bắt buộc, cách nhau bởi dấu phẩy"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    min_rating: Optional[float] = Query(None, ge=0, le=5),
+    sort: str = Query("newest", pattern="^(newest|price_asc|price_desc|rating)$"),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor của trang trước"),
+    db: Session = Depends(get_db)
+):
+    params = dict(
+        q=q, sport_type=sport_type, amenities=amenities, min_price=min_price, max_price=max_price,
+        min_rating=min_rating, sort=sort, limit=limit, cursor=cursor,
+    )
+    key = "facilities:search:" + json.dumps(params, sort_keys=True)
+    return cached_json_response(request, key, lambda: build_facility_search(db, **params), partition="search")
+
+def build_facility_search(
+    db: Session, q, sport_type, amenities, min_price, max_price, min_rating, sort, limit, cursor
+):
+    sort_column, ascending = SEARCH_SORTS[sort]
+    query = db.query(Facility, sort_column.label("sort_value")).filter(Facility.is_active == True)
+
+    sports = split_csv(sport_type)
+    if sports:
+        query = query.filter(Facility.sport_type.overlap(sports))
+    required_amenities = split_csv(amenities)
+    if required_amenities:
+        query = query.filter(Facility.amenities.contains(required_amenities))
+    if min_price is not None:
+        query = query.filter(Facility.price_per_hour >= min_price)
+    if max_price is not None:
+        query = query.filter(Facility.price_per_hour <= max_price)
+    if min_rating is not None:
+        query = query.filter(Facility.rating >= min_rating)
+    if q and q.strip():
+        query = query.filter(
+            literal_column(FACILITY_SEARCH_DOCUMENT).op("@@")(
+                func.plainto_tsquery(literal_column("'simple'::regconfig"), func.f_unaccent(q.strip()))
+            )
+        )
+
+    # Keyset pagination theo (giá trị sắp xếp, id)
+    if cursor:
+        try:
+            last_value, last_id = decode_cursor(cursor)
+            if sort == "newest":
+                last_value = datetime.fromisoformat(last_value)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+        position = tuple_(sort_column, Facility.id)
+        boundary = tuple_(last_value, last_id)
+        query = query.filter(position > boundary if ascending else position < boundary)
+
+    if ascending:
+        query = query.order_by(sort_column.asc(), Facility.id.asc())
+    else:
+        query = query.order_by(sort_column.desc(), Facility.id.desc())
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last, last_value = rows[-1]
+        next_cursor = encode_cursor([
+            last_value.isoformat() if isinstance(last_value, datetime) else last_value,
+            last.id,
+        ])
+
+    return {
+        "items": [
+            {
+                "id": f.id,
+                "name": f.name,
+                "sport_type": f.sport_type,
+                "price_per_hour": f.price_per_hour,
+                "cover_image": f.cover_image,
+                "cover_image_variants": image_variants(f.cover_image),
+                "location": f.location,
+                "rating": f.rating,
+                "reviews_count": f.reviews_count,
+                "amenities": f.amenities,
+                "opening_hours": f.opening_hours,
+            }
+            for f, _ in rows
+        ],
+        "next_cursor": next_cursor,
+    }
+
+NEARBY_DEFAULT_RADIUS_M = 5000
+NEARBY_MAX_RADIUS_M = 50000
+NEARBY_PAGE_SIZE = 20
+NEARBY_MAX_PAGE_SIZE = 100
+# Khi lọc theo giờ trống, lấy tối đa limit * hệ số này sân gần nhất để kiểm tra
+NEARBY_AVAILABILITY_SCAN_FACTOR = 5
+
+def _explicit_court_ids(value) -> Optional[List[int]]:
+    """Danh sách id court ghi sẵn trong layout ("court_ids": [...]), None nếu không có/không hợp lệ."""
+    if not isinstance(value, list):
+        return None
+    try:
+        return [int(court_id) for court_id in value]
+    except (TypeError, ValueError):
+        return None
+
+def court_ids(layout, sport: str, sports: Optional[List[str]] = None) -> List[int]:
+    """Các id court của một môn theo court_layout, mặc định [0].
+
+    Layout ghi sẵn "court_ids" thì dùng đúng các id đó; không thì court được đánh
+    số liên tiếp từ 0 theo court_counts (như trang chi tiết sân). total_courts
+    không gắn môn chỉ được tính khi sân có đúng một môn (sports).
+    Quy tắc đếm giống COURTS_PER_SPORT_SQL.
+    """
+    ids: List[int] = []
+    if isinstance(layout, list):
+        for item in layout:
+            if not isinstance(item, dict) or item.get("sport_type") != sport:
+                continue
+            explicit = _explicit_court_ids(item.get("court_ids"))
+            if explicit is not None:
+                ids += explicit
+                continue
+            try:
+                count = int(item.get("court_counts") or 0)
+            except (TypeError, ValueError):
+                count = 0
+            ids += range(len(ids), len(ids) + count)
+    elif isinstance(layout, dict):
+        explicit = layout.get("court_ids")
+        explicit = _explicit_court_ids(explicit.get(sport)) if isinstance(explicit, dict) else None
+        per_sport = layout.get("court_counts")
+        try:
+            if explicit is not None:
+                ids = explicit
+            elif isinstance(per_sport, dict) and per_sport.get(sport):
+                ids = list(range(int(per_sport[sport])))
+            elif layout.get("sport_type") == sport or (sports is not None and len(set(sports)) == 1):
+                ids = list(range(int(layout.get("total_courts") or 1)))
+        except (TypeError, ValueError):
+            ids = []
+    return sorted(set(ids)) or [0]
+
+def can_fit_slot(facility: Facility, start: datetime, end: datetime) -> bool:
+    open_dt, close_dt = opening_window(facility.opening_hours, start.date())
+    return open_dt <= start and end <= close_dt
+
+def has_free_court(db: Session, facility: Facility, sports: List[str], start: datetime, end: datetime) -> bool:
+    if not can_fit_slot(facility, start, end):
+        return False
+    for sport in sports:
+        for court_id in court_ids(facility.court_layout, sport, facility.sport_type):
+            if availability_index.is_free(db, facility.id, sport, court_id, start, end):
+                return True
+    return False
+
+@router.get("/nearby")
+def get_nearby_facilities(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(NEARBY_DEFAULT_RADIUS_M, gt=0, le=NEARBY_MAX_RADIUS_M, description="Bán kính (mét)"),
+    sport_type: Optional[str] = Query(None, description="Một hoặc nhiều môn, cách nhau bởi dấu phẩy"),
+    on_date: Optional[date] = Query(None, alias="date", description="Chỉ lấy sân còn trống ngày này (YYYY-MM-DD)"),
+    start: Optional[str] = Query(None, description="Giờ bắt đầu (HH:MM), dùng cùng date"),
+    duration_minutes: int = Query(60, ge=15, le=24 * 60),
+    limit: int = Query(NEARBY_PAGE_SIZE, ge=1, le=NEARBY_MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    slot_start = slot_end = None
+    if on_date is not None or start is not None:
+        if on_date is None or start is None:
+            raise HTTPException(status_code=400, detail="Cần cả date và start để lọc sân trống")
+        try:
+            slot_start = datetime.combine(on_date, time.fromisoformat(start))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Giờ bắt đầu không hợp lệ (HH:MM)")
+        slot_end = slot_start + timedelta(minutes=duration_minutes)
+
+    origin = func.ll_to_earth(lat, lng)
+    point = func.ll_to_earth(Facility.latitude, Facility.longitude)
+    distance = func.earth_distance(origin, point)
+    query = (
+        db.query(Facility, distance.label("distance"))
+        .filter(
+            Facility.is_active == True,
+            # earth_box dùng index ix_facilities_earth; earth_distance loại phần góc thừa của hộp
+            func.earth_box(origin, radius).op("@>")(point),
+            distance <= radius,
+        )
+        .order_by(distance, Facility.id)
+    )
+    sports = split_csv(sport_type)
+    if sports:
+        query = query.filter(Facility.sport_type.overlap(sports))
+
+    if slot_start is None:
+        rows = query.limit(limit).all()
+    else:
+        candidates = [
+            (f, d, [s for s in f.sport_type or [] if not sports or s in sports])
+            for f, d in query.limit(limit * NEARBY_AVAILABILITY_SCAN_FACTOR).all()
+        ]
+        # Nạp lịch ngày đó của mọi court ứng viên bằng một query thay vì một query mỗi court
+        availability_index.preload(db, [
+            (f.id, sport, court_id, slot_start.date())
+            for f, _, wanted in candidates
+            if can_fit_slot(f, slot_start, slot_end)
+            for sport in wanted
+            for court_id in court_ids(f.court_layout, sport, f.sport_type)
+        ])
+        rows = []
+        for f, d, wanted in candidates:
+            if has_free_court(db, f, wanted, slot_start, slot_end):
+                rows.append((f, d))
+                if len(rows) == limit:
+                    break
+
+    return [
+        {
+            "id": f.id,
+            "name": f.name,
+            "sport_type": f.sport_type,
+            "price_per_hour": f.price_per_hour,
+            "cover_image": f.cover_image,
+            "cover_image_variants": image_variants(f.cover_image),
+            "location": f.location,
+            "latitude": f.latitude,
+            "longitude": f.longitude,
+            "distance_m": round(d),
+            "rating": f.rating,
+            "reviews_count": f.reviews_count,
+            "opening_hours": f.opening_hours,
+        }
+        for f, d in rows
+    ]
+
+def facility_files(facility: Facility) -> List[str]:
+    """Các file upload mà sân đang dùng (mỗi lần xuất hiện là một tham chiếu)."""
+    return [facility.cover_image, *parse_images(facility.images)]
+
 class CourtLayoutItem(BaseModel):
     sport_type: str
     court_counts: int
@@ -179,12 +451,16 @@ class FacilityResponse(BaseModel):
     price_per_hour: float
     cover_image: Optional[str] = None
     location: Optional[str] = None                  
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     rating: float
     reviews_count: int
     amenities: List[str] = []                       
     opening_hours: Optional[str] = None            
     is_active: bool
     images: List[str] = Field(default_factory=list)
+    cover_image_variants: Dict[str, str] = Field(default_factory=dict)
+    image_variants: List[Dict[str, str]] = Field(default_factory=list)
 
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -199,14 +475,16 @@ async def create_facility_with_upload(
     description: Optional[str] = Form(None),
     price_per_hour: float = Form(...),
     location: Optional[str] = Form(None),
+    latitude: Optional[float] = Form(None, ge=-90, le=90),
+    longitude: Optional[float] = Form(None, ge=-180, le=180),
     amenities: Optional[str] = Form(None),
     opening_hours: Optional[str] = Form(None),
     court_layout: Optional[str] = Form(None), 
     cover_image: Optional[UploadFile] = File(None),          
     # ✅ Bỏ facility_images parameter, sẽ lấy từ request
 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
     if current_user.role not in ["host", "admin"]:
         raise HTTPException(status_code=403, detail="Chỉ chủ sân hoặc admin mới có thể tạo sân")
@@ -228,24 +506,19 @@ async def create_facility_with_upload(
     amenities_list = [s.strip() for s in amenities.split(",")] if amenities else []
     court_layout_obj = json.loads(court_layout) if court_layout else None
 
-    cover_path: Optional[str] = None
-    if cover_image:
-        saved = await save_file(cover_image)
-        cover_path = os.path.join("uploads", os.path.basename(saved))
-
-    # Process facility_images
-    images_paths: List[str] = []
-    for i, f in enumerate(facility_images_list):
-        print(f"Saving image {i}: {f.filename}")
-        saved = await save_file(f)
-        path = os.path.join("uploads", os.path.basename(saved))
-        images_paths.append(path)
-        print(f"Saved image {i} to: {path}")
+    # Lưu ảnh bìa và ảnh sân đồng thời (kèm bản WebP thumb/medium/large),
+    # giới hạn dung lượng chung cho cả request
+    uploads = [cover_image] if cover_image else []
+    saved = await save_files(uploads + facility_images_list, variants=True)
+    cover_upload = saved[0] if cover_image else None
+    image_uploads = saved[1:] if cover_image else saved
+    images_paths: List[str] = [u.path for u in image_uploads]
 
     print(f"Total images saved: {len(images_paths)}")
 
-    if not cover_path and images_paths:
-        cover_path = images_paths[0]
+    if cover_upload is None and image_uploads:
+        cover_upload = image_uploads[0]
+    cover_path: Optional[str] = cover_upload.path if cover_upload else None
 
     images_str = json.dumps(images_paths) if images_paths else None
 
@@ -258,6 +531,8 @@ async def create_facility_with_upload(
         price_per_hour=price_per_hour,
         cover_image=cover_path,
         location=location,
+        latitude=latitude,
+        longitude=longitude,
         amenities=amenities_list,
         opening_hours=opening_hours,
         images=images_str,
@@ -265,8 +540,10 @@ async def create_facility_with_upload(
 
     try:
         db.add(new_facility)
-        db.commit()
-        db.refresh(new_facility)
+        await acquire_files(db, facility_files(new_facility))
+        await db.commit()
+        await db.refresh(new_facility)
+        await catalog_cache.invalidate()
         return FacilityResponse(
             id=new_facility.id,
             name=new_facility.name,
@@ -276,31 +553,35 @@ async def create_facility_with_upload(
             description=new_facility.description,
             price_per_hour=new_facility.price_per_hour,
             cover_image=new_facility.cover_image,
+            cover_image_variants=cover_upload.variants if cover_upload else {},
             location=new_facility.location,
+            latitude=new_facility.latitude,
+            longitude=new_facility.longitude,
             rating=new_facility.rating,
             reviews_count=new_facility.reviews_count,
             amenities=new_facility.amenities or [],
             opening_hours=new_facility.opening_hours,
             is_active=new_facility.is_active,
             images=images_paths,
+            image_variants=[u.variants for u in image_uploads],
             created_at=new_facility.created_at,
             updated_at=new_facility.updated_at,
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Lỗi khi tạo sân: {str(e)}")
     
 @router.put("/{facility_id}", response_model=FacilityResponse)
 async def update_facility(
     facility_id: int,
     facility_data: FacilityUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Cập nhật thông tin sân
     """
-    facility = db.query(Facility).filter(Facility.id == facility_id).first()
+    facility = await db.get(Facility, facility_id)
     
     if not facility:
         raise HTTPException(
@@ -320,15 +601,21 @@ async def update_facility(
     if "court_layout" in update_data and update_data["court_layout"]:
         update_data["court_layout"] = update_data["court_layout"]
     
+    old_files = facility_files(facility)
     for field, value in update_data.items():
         setattr(facility, field, value)
+    new_files = facility_files(facility)
+    if new_files != old_files:
+        await release_files(db, old_files)
+        await acquire_files(db, new_files)
     
     try:
-        db.commit()
-        db.refresh(facility)
+        await db.commit()
+        await db.refresh(facility)
+        await catalog_cache.invalidate()
         return facility
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Lỗi khi cập nhật sân: {str(e)}"
@@ -338,13 +625,19 @@ async def update_facility(
 @router.delete("/{facility_id}")
 async def delete_facility(
     facility_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Xóa sân
     """
-    facility = db.query(Facility).filter(Facility.id == facility_id).first()
+    # Nạp sẵn các quan hệ mà ORM cần khi xóa (AsyncSession không lazy load được)
+    result = await db.execute(
+        select(Facility)
+        .options(selectinload(Facility.bookings), selectinload(Facility.liked_by))
+        .where(Facility.id == facility_id)
+    )
+    facility = result.scalar_one_or_none()
     
     if not facility:
         raise HTTPException(
@@ -360,11 +653,13 @@ async def delete_facility(
         )
     
     try:
-        db.delete(facility)
-        db.commit()
+        await release_files(db, facility_files(facility))
+        await db.delete(facility)
+        await db.commit()
+        await catalog_cache.invalidate()
         return {"message": "Xóa sân thành công"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Lỗi khi xóa sân: {str(e)}"
@@ -375,13 +670,13 @@ async def delete_facility(
 async def update_facility_status(
     facility_id: int,
     is_active: bool,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Cập nhật trạng thái sân (hoạt động/tạm ngưng)
     """
-    facility = db.query(Facility).filter(Facility.id == facility_id).first()
+    facility = await db.get(Facility, facility_id)
     
     if not facility:
         raise HTTPException(
@@ -399,10 +694,11 @@ async def update_facility_status(
     facility.is_active = is_active
     
     try:
-        db.commit()
+        await db.commit()
+        await catalog_cache.invalidate()
         return {"message": "Cập nhật trạng thái thành công", "is_active": is_active}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Lỗi khi cập nhật trạng thái: {str(e)}"
@@ -410,7 +706,12 @@ async def update_facility_status(
 
 # API lấy chi tiết sân theo id
 @router.get("/detail/{facility_id}")
-def get_facility_detail(facility_id: int, db: Session = Depends(get_db)):
+def get_facility_detail(facility_id: int, request: Request, db: Session = Depends(get_db)):
+    return cached_json_response(
+        request, f"facilities:detail:{facility_id}", lambda: build_facility_detail(db, facility_id)
+    )
+
+def build_facility_detail(db: Session, facility_id: int):
     facility = db.query(Facility).filter(Facility.id == facility_id, Facility.is_active == True).first()
     if not facility:
         raise HTTPException(status_code=404, detail="Facility not found")
@@ -422,7 +723,10 @@ def get_facility_detail(facility_id: int, db: Session = Depends(get_db)):
         "description": facility.description,
         "price_per_hour": facility.price_per_hour,
         "cover_image": facility.cover_image,
+        "cover_image_variants": image_variants(facility.cover_image),
         "location": facility.location,
+        "latitude": facility.latitude,
+        "longitude": facility.longitude,
         "rating": facility.rating,
         "reviews_count": facility.reviews_count,
         "amenities": facility.amenities,
@@ -431,33 +735,76 @@ def get_facility_detail(facility_id: int, db: Session = Depends(get_db)):
         "created_at": facility.created_at,
         "updated_at": facility.updated_at,
         "owner_id": facility.owner_id,
-        "images": facility.images
+        "images": facility.images,
+        "image_variants": [image_variants(p) for p in parse_images(facility.images)]
     }
 
 @router.get("/count")
-def count_active_facilities(db: Session = Depends(get_db)):
-    return {"count": db.query(Facility).filter(Facility.is_active == True).count()}
+def count_active_facilities(request: Request, db: Session = Depends(get_db)):
+    return cached_json_response(
+        request, "facilities:count",
+        lambda: {"count": db.query(Facility).filter(Facility.is_active == True).count()}
+    )
 
 @router.get("/popular-sports")
-def get_popular_sports(db: Session = Depends(get_db)):
-    results = (
-        db.query(Facility.sport_type, func.count(Facility.id).label("courts"))
-        .filter(Facility.is_active == True)
-        .group_by(Facility.sport_type)
-        .all()
+def get_popular_sports(request: Request, db: Session = Depends(get_db)):
+    return cached_json_response(request, "facilities:popular-sports", lambda: count_popular_sports(db))
+
+def _sql_int(expr: str) -> str:
+    """Ép text JSON sang int trong SQL, NULL nếu không phải số nguyên không âm.
+
+    court_layout là JSON tự do do host nhập: ép thẳng ::int sẽ làm cả query lỗi
+    chỉ vì một sân có giá trị hỏng.
+    """
+    return f"(CASE WHEN ({expr}) ~ '^[0-9]{{1,9}}$' THEN ({expr})::int END)"
+
+def _sql_id_count(value: str) -> str:
+    """Số phần tử của "court_ids" nếu là mảng JSON, không thì NULL."""
+    return f"(CASE WHEN json_typeof({value}) = 'array' THEN json_array_length({value}) END)"
+
+# Số court của môn s.sport ở sân f, đếm theo cùng quy tắc với court_ids()
+COURTS_PER_SPORT_SQL = f"""
+    CASE json_typeof(f.court_layout)
+    WHEN 'array' THEN coalesce(nullif((
+        SELECT sum(coalesce({_sql_id_count("item->'court_ids'")}, {_sql_int("item->>'court_counts'")}))
+        FROM json_array_elements(f.court_layout) AS item
+        WHERE json_typeof(item) = 'object' AND item->>'sport_type' = s.sport
+    ), 0), 1)
+    WHEN 'object' THEN coalesce(
+        nullif({_sql_id_count("f.court_layout->'court_ids'->s.sport")}, 0),
+        nullif({_sql_int("f.court_layout->'court_counts'->>s.sport")}, 0),
+        CASE WHEN f.court_layout->>'sport_type' = s.sport
+                  OR (SELECT count(DISTINCT x) FROM unnest(f.sport_type) AS x) = 1
+             THEN coalesce(nullif({_sql_int("f.court_layout->>'total_courts'")}, 0), 1) END,
+        1
     )
-    return [{"sportType": r.sport_type, "courts": r.courts} for r in results]
+    ELSE 1
+    END
+"""
+
+POPULAR_SPORTS_SQL = text(f"""
+    SELECT s.sport AS sport, count(*) AS facilities, sum({COURTS_PER_SPORT_SQL}) AS courts
+    FROM facilities AS f
+    CROSS JOIN LATERAL (SELECT DISTINCT unnest(f.sport_type) AS sport) AS s
+    WHERE f.is_active
+    GROUP BY s.sport
+    ORDER BY courts DESC, s.sport
+""")
+
+def count_popular_sports(db: Session):
+    # unnest để mỗi môn của sân là một dòng (group theo cả mảng sẽ biến
+    # ["badminton", "tennis"] thành một nhóm riêng); DB chỉ trả về một dòng mỗi môn
+    return [
+        {"sportType": row.sport, "courts": int(row.courts), "facilities": row.facilities}
+        for row in db.execute(POPULAR_SPORTS_SQL)
+    ]
 
 @router.post("/{facility_id}/favorite")
 def add_favorite(
     facility_id: int,
-    token: str = Depends(oauth2_scheme),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-    user_id = payload["id"]
 
     # kiểm tra facility có tồn tại không
     facility = db.query(Facility).filter(Facility.id == facility_id).first()
@@ -480,13 +827,9 @@ def add_favorite(
 @router.delete("/{facility_id}/favorite")
 def remove_favorite(
     facility_id: int,
-    token: str = Depends(oauth2_scheme),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-    user_id = payload["id"]
 
     favorite = db.query(UserFavorite).filter_by(user_id=user_id, facility_id=facility_id).first()
     if not favorite:
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from auth import get_db, oauth2_scheme, verify_token, get_current_user
+from auth import get_db, get_current_user_id
 from models import UserFavorite
 from models import User
 
@@ -11,13 +11,9 @@ router = APIRouter(
 
 @router.get("/favorites")
 def get_favorites(
-    token: str = Depends(oauth2_scheme),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-    user_id = payload["id"]
 
     favorites = db.query(UserFavorite.facility_id).filter(UserFavorite.user_id == user_id).all()
     return [f.facility_id for f in favorites]
\ No newline at end of file
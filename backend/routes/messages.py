@@ -1,11 +1,11 @@
 from datetime import datetime
 from models import *
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, select
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
-from auth import get_current_user, get_current_user_ws  
-from services.connection_manager import manager
+from database import get_db, get_async_db
+from auth import get_current_principal, Principal
 from fastapi import Query
 from pydantic import BaseModel
 
@@ -33,7 +33,7 @@ class MessageCreate(BaseModel):
 def send_message(
     payload: MessageSendRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     receiver = db.query(User).filter(User.id == payload.receiver_id).first()
     if not receiver:
@@ -53,15 +53,18 @@ def send_message(
 async def get_chat_history(
     user_id: int, 
     limit: int = 50,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    messages = db.query(Message).filter(
-        or_(
-            and_(Message.sender_id == current_user.id, Message.receiver_id == user_id),
-            and_(Message.sender_id == user_id, Message.receiver_id == current_user.id)
-        )
-    ).order_by(Message.created_at.desc()).limit(limit).all()
+    result = await db.execute(
+        select(Message).where(
+            or_(
+                and_(Message.sender_id == current_user.id, Message.receiver_id == user_id),
+                and_(Message.sender_id == user_id, Message.receiver_id == current_user.id)
+            )
+        ).order_by(Message.created_at.desc()).limit(limit)
+    )
+    messages = result.scalars().all()
     
     # Reverse để có thứ tự từ cũ đến mới
     return [
@@ -80,7 +83,7 @@ async def get_chat_history(
 def mark_messages_as_read(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     db.query(Message).filter(
         Message.sender_id == user_id,
@@ -1,38 +1,118 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
-from sqlalchemy import update
-from sqlalchemy import case, desc
+from sqlalchemy import update, func, tuple_
 from database import get_db
-from models import Notification
-from auth import verify_token, oauth2_scheme, get_current_user_id
+from models import Notification, NOTIFICATION_PRIORITY_RANKS, NOTIFICATION_DEFAULT_RANK
+from auth import verify_token, get_current_user_id
+from services.connection_manager import notification_manager
+from utils import encode_cursor, decode_cursor
 
 router = APIRouter(prefix="/api/notifications", tags=["Notifications"])
 
+NOTIFICATIONS_PAGE_SIZE = 50
+NOTIFICATIONS_MAX_PAGE_SIZE = 200
+
+# Các nhóm (read, priority_rank) theo đúng thứ tự hiển thị:
+# chưa đọc trước, rồi high -> medium -> low -> khác
+NOTIFICATION_GROUPS = [
+    (read, rank)
+    for read in (False, True)
+    for rank in sorted(set(NOTIFICATION_PRIORITY_RANKS.values()) | {NOTIFICATION_DEFAULT_RANK})
+]
+
+def notification_cursor(n: Notification) -> str:
+    return encode_cursor([n.read, n.priority_rank, n.timestamp.isoformat(), n.id])
+
+def parse_notification_cursor(cursor: str):
+    try:
+        read, rank, timestamp, notification_id = decode_cursor(cursor)
+        after = bool(read), int(rank), datetime.fromisoformat(timestamp), int(notification_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    if (after[0], after[1]) not in NOTIFICATION_GROUPS:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    return after
+
 @router.get("/")
 def get_notifications(
+    response: Response,
+    limit: Optional[int] = Query(
+        None, ge=1, le=NOTIFICATIONS_MAX_PAGE_SIZE,
+        description=f"Số notification mỗi trang; bỏ trống cả limit và cursor để lấy toàn bộ (mặc định trang {NOTIFICATIONS_PAGE_SIZE} khi có cursor)"
+    ),
+    cursor: Optional[str] = Query(None, description="Giá trị header X-Next-Cursor của trang trước"),
     current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    priority_order = case(
-        (Notification.priority == "high", 1),
-        (Notification.priority == "medium", 2),
-        (Notification.priority == "low", 3),
-        else_=4
-    )
+    # Keyset pagination theo (read, priority_rank, timestamp DESC, id DESC).
+    # Mỗi nhóm (read, priority_rank) là một đoạn liên tục của index
+    # ix_notifications_user_feed nên mỗi query chỉ là một lần seek + đọc tuần tự.
+    # Không có limit lẫn cursor: trả toàn bộ như trước (client cũ không đọc X-Next-Cursor)
+    if limit is None and cursor is not None:
+        limit = NOTIFICATIONS_PAGE_SIZE
+    after = parse_notification_cursor(cursor) if cursor else None
+    groups = NOTIFICATION_GROUPS
+    if after:
+        groups = groups[groups.index((after[0], after[1])):]
 
-    notifications = (
-        db.query(Notification)
-        .filter(Notification.user_id == current_user_id)
-        .order_by(
-            Notification.read.asc(),     # chưa đọc (False=0) trước, đã đọc (True=1) sau
-            priority_order,              # high -> medium -> low
-            desc(Notification.timestamp) # mới nhất trước
+    notifications = []
+    for read, rank in groups:
+        query = db.query(Notification).filter(
+            Notification.user_id == current_user_id,
+            Notification.read == read,
+            Notification.priority_rank == rank,
         )
-        .all()
-    )
+        if after and (read, rank) == (after[0], after[1]):
+            query = query.filter(
+                tuple_(Notification.timestamp, Notification.id) < tuple_(after[2], after[3])
+            )
+        query = query.order_by(Notification.timestamp.desc(), Notification.id.desc())
+        if limit is not None:
+            query = query.limit(limit + 1 - len(notifications))
+        notifications += query.all()
+        if limit is not None and len(notifications) > limit:
+            break
+
+    if limit is not None and len(notifications) > limit:
+        notifications = notifications[:limit]
+        response.headers["X-Next-Cursor"] = notification_cursor(notifications[-1])
 
     return notifications
 
+@router.get("/unread-count")
+def get_unread_count(
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    count = (
+        db.query(func.count(Notification.id))
+        .filter(Notification.user_id == current_user_id, Notification.read == False)
+        .scalar()
+    )
+    return {"unread": count}
+
+# ws://localhost:8000/api/notifications/ws?token=<token>
+# Notification mới được đẩy ngay qua socket này, frontend không cần polling
+@router.websocket("/ws")
+async def notifications_websocket(websocket: WebSocket, token: str = Query(...)):
+    payload = verify_token(token)
+    if not payload or payload.get("id") is None:
+        await websocket.close(code=1008)
+        return
+
+    user_id = payload["id"]
+    await notification_manager.connect(user_id, websocket)
+    try:
+        while True:
+            # Client chỉ gửi ping để giữ kết nối
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        notification_manager.disconnect(user_id, websocket)
+
 @router.patch("/{notification_id}/read")
 def mark_as_read(notification_id: int, db: Session = Depends(get_db)):
     result = db.execute(
@@ -48,35 +128,23 @@ def mark_as_read(notification_id: int, db: Session = Depends(get_db)):
     return {"id": row.id, "read": row.read}
 
 @router.patch("/mark-all-read")
-def mark_all_as_read(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-
-    user_id = payload["id"]
-
-    notifications = db.query(Notification).filter(
-        Notification.user_id == user_id,
-        Notification.read == False
-    ).all()
-
-    for n in notifications:
-        n.read = True
+def mark_all_as_read(user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
 
+    # Một câu UPDATE cho tất cả, không nạp từng notification vào bộ nhớ
+    result = db.execute(
+        update(Notification)
+        .where(Notification.user_id == user_id, Notification.read == False)
+        .values(read=True)
+    )
     db.commit()
-    return {"message": f"{len(notifications)} notifications marked as read"}
+    return {"message": f"{result.rowcount} notifications marked as read"}
 
 @router.delete("/{notification_id}")
 def delete_notification(
     notification_id: int,
-    token: str = Depends(oauth2_scheme),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token không hợp lệ")
-
-    user_id = payload["id"]
 
     notification = db.query(Notification).filter(
         Notification.id == notification_id,
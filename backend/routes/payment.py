@@ -1,12 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
 from fastapi.responses import StreamingResponse, JSONResponse
 import asyncio, json
 from payos import PayOS, ItemData, PaymentData
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import Booking, User
-from auth import get_current_user
+from auth import get_current_principal, Principal
+from services.payments import (
+    create_payment_order, get_payment_status, record_payment_result, wait_for_payment,
+    FINAL_STATUSES, PAYMENT_WAIT_MAX_SECONDS,
+    PAYMENT_STREAM_TIMEOUT_SECONDS, PAYMENT_STREAM_KEEPALIVE_SECONDS
+)
 from dotenv import load_dotenv
 import os
 import time
@@ -14,7 +19,7 @@ import qrcode
 import base64
 from io import BytesIO
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import List, Optional
 
 router = APIRouter(prefix="/api/payment", tags=["Payment"])
 
@@ -29,7 +34,6 @@ payos = PayOS(
 )
 
 YOUR_DOMAIN = "http://localhost:3000"
-payment_status_cache: Dict[str, dict] = {}
 
 class BookingPaymentData(BaseModel):
     order_code: str  
@@ -37,19 +41,30 @@ class BookingPaymentData(BaseModel):
     sport_type: str
     booking_date: str
     total_price: float
+    booking_id: Optional[int] = None  # booking được đánh dấu "paid" khi thanh toán xong
 
 
 @router.post("/create-payment-link")
 async def create_payment_link(
     booking_data: BookingPaymentData,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    if booking_data.booking_id is not None:
+        booking = await db.get(Booking, booking_data.booking_id)
+        if not booking or booking.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Không tìm thấy booking")
+
     try:
         
         # Lấy order_code từ frontend
         order_code = booking_data.order_code
         
+        # Ghi đơn trước khi tạo link để webhook tới sớm vẫn tìm thấy booking
+        await create_payment_order(
+            db, order_code, int(booking_data.total_price), current_user.id, booking_data.booking_id
+        )
+
         # Create payment data
         item = ItemData(
             name=f"Đặt sân {booking_data.facility_name}",
@@ -100,25 +115,14 @@ async def payment_webhook(request: Request):
         order_code = str(getattr(webhook_data, 'orderCode', 'unknown'))
 
         # Kiểm tra success từ webhook_data
-        if webhook_data and webhook_data.code == '00' and webhook_data.desc.lower() == 'success':
-            payment_status_cache[order_code] = {
-                "status": "success",
-                "order_code": order_code,
-                "amount": getattr(webhook_data, 'amount', 0),
-                "message": "Thanh toán thành công!"
-            }
+        success = bool(webhook_data and webhook_data.code == '00' and webhook_data.desc.lower() == 'success')
+        # Lưu vào DB (dùng chung mọi worker); webhook gửi lặp lại không đổi kết quả
+        result = await record_payment_result(order_code, success, getattr(webhook_data, 'amount', 0))
+        if success:
             print(f"✅ Payment SUCCESS: Order {order_code}")
         else:
-            payment_status_cache[order_code] = {
-                "status": "failed",
-                "order_code": order_code,
-                "amount": getattr(webhook_data, 'amount', 0),
-                "message": "Thanh toán thất bại!"
-            }
             print(f"❌ Payment FAILED: Order {order_code}")
 
-        result = payment_status_cache[order_code]
-
     except Exception as e:
         print(f"❌ Error verifying webhook: {e}")
         result = {
@@ -134,22 +138,58 @@ async def check_payment_status(order_code: str):
     Endpoint để frontend polling trạng thái thanh toán
     """
     try:
-        # Kiểm tra trong cache trước
-        if order_code in payment_status_cache:
-            cached_status = payment_status_cache[order_code]
-            print(f"📋 Returning cached status for order {order_code}: {cached_status['status']}")
-            return cached_status
-        
-        # Nếu chưa có trong cache, trả về pending
-        return {
-            "status": "pending",
-            "order_code": order_code,
-            "message": "Đang chờ thanh toán..."
-        }
-        
+        # Đọc từ cache trong process, chưa có thì đọc bảng payment_orders
+        return await get_payment_status(order_code)
+
     except Exception as e:
         return {
             "status": "error",
             "order_code": order_code,
             "message": str(e)
         }
+
+@router.get("/wait/{order_code}")
+async def wait_payment_status(
+    order_code: str,
+    timeout: float = Query(25, gt=0, le=PAYMENT_WAIT_MAX_SECONDS)
+):
+    """
+    Long-poll: giữ request tới khi webhook báo kết quả hoặc hết `timeout` giây
+    (khi đó trả "pending", frontend gọi lại ngay)
+    """
+    return await wait_for_payment(order_code, timeout)
+
+def sse_event(data: dict) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.get("/stream/{order_code}")
+async def stream_payment_status(order_code: str):
+    """
+    Server-Sent Events: gửi trạng thái hiện tại, rồi gửi kết quả ngay khi webhook tới.
+    Stream đóng sau khi có kết quả hoặc sau PAYMENT_STREAM_TIMEOUT_SECONDS
+    (EventSource tự kết nối lại).
+    """
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + PAYMENT_STREAM_TIMEOUT_SECONDS
+        # Client mất kết nối thì EventSource thử lại sau 3 giây
+        yield "retry: 3000\n\n"
+
+        result = await get_payment_status(order_code)
+        yield sse_event(result)
+        while result["status"] not in FINAL_STATUSES:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            result = await wait_for_payment(order_code, min(PAYMENT_STREAM_KEEPALIVE_SECONDS, remaining))
+            if result["status"] in FINAL_STATUSES:
+                yield sse_event(result)
+            else:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Tắt buffer của nginx để event tới client ngay
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -3,6 +3,7 @@ from models import *
 from database import engine, SessionLocal
 from datetime import datetime, timedelta
 from auth import hash_password
+from migrations import run_migrations
 
 def seed_facilities(db: Session):
     if db.query(Facility).count() == 0:
@@ -262,6 +263,7 @@ def seed_bookings(db: Session):
 def init_db():
     # Tạo bảng nếu chưa có
     Base.metadata.create_all(bind=engine, checkfirst=True)
+    run_migrations()
 
     db: Session = SessionLocal()
     try:
@@ -0,0 +1,263 @@
+import bisect
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, any_, bindparam, func
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+from models import Booking
+
+# Số ngày (facility, sport, court, date) tối đa giữ trong bộ nhớ
+AVAILABILITY_MAX_DAYS = int(os.getenv("AVAILABILITY_MAX_DAYS", 5000))
+# Sau khoảng này một ngày được nạp lại từ DB (booking do worker khác tạo)
+AVAILABILITY_TTL_SECONDS = float(os.getenv("AVAILABILITY_TTL_SECONDS", 30))
+SLOT_MINUTES = 60
+
+# Booking ở các trạng thái này không còn giữ sân
+RELEASED_STATUSES = ("cancelled",)
+
+# Court đánh số riêng theo từng môn (court_layout), nên khóa gồm cả sport_type
+DayKey = Tuple[int, Optional[str], int, date]
+
+
+class DaySchedule:
+    """Các khoảng đã đặt của một court trong một ngày, sắp theo giờ bắt đầu."""
+
+    __slots__ = ("starts", "ends", "ids", "max_ends", "loaded_at")
+
+    def __init__(self, intervals: List[Tuple[datetime, datetime, int]]):
+        intervals.sort()
+        self.starts = [s for s, _, _ in intervals]
+        self.ends = [e for _, e, _ in intervals]
+        self.ids = [i for _, _, i in intervals]
+        self._rebuild()
+        self.loaded_at = monotonic()
+
+    def _rebuild(self):
+        # max_ends[i] = giờ kết thúc muộn nhất trong các khoảng [0..i],
+        # vẫn đúng cả khi dữ liệu cũ có các booking chồng nhau
+        self.max_ends = []
+        latest = None
+        for end in self.ends:
+            latest = end if latest is None or end > latest else latest
+            self.max_ends.append(latest)
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        # Các khoảng có start < end nằm ở [0, i); chồng lấn nếu khoảng nào kết thúc sau start
+        i = bisect.bisect_left(self.starts, end)
+        return i > 0 and self.max_ends[i - 1] > start
+
+    def add(self, start: datetime, end: datetime, booking_id: int):
+        if booking_id in self.ids:
+            return
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, booking_id)
+        self._rebuild()
+
+    def remove(self, booking_id: int):
+        if booking_id not in self.ids:
+            return
+        i = self.ids.index(booking_id)
+        del self.starts[i], self.ends[i], self.ids[i]
+        self._rebuild()
+
+
+def _parse_close(value: str) -> Optional[time]:
+    # "24:00" (time.fromisoformat không đọc được) hay "00:00" đều là đóng cửa lúc hết ngày
+    if value in ("24:00", "00:00"):
+        return None
+    return time.fromisoformat(value)
+
+
+def parse_opening_hours(opening_hours: Optional[str]) -> Tuple[time, Optional[time]]:
+    """Đọc giờ mở cửa dạng "06:00 - 22:00", mặc định cả ngày nếu không đọc được.
+
+    Giờ đóng None nghĩa là mở tới hết ngày (0h hôm sau), để slot 23:00-24:00 vẫn đặt được.
+    """
+    try:
+        open_str, close_str = [p.strip() for p in opening_hours.split("-")]
+        return time.fromisoformat(open_str), _parse_close(close_str)
+    except (AttributeError, ValueError):
+        return time(0, 0), None
+
+
+def opening_window(opening_hours: Optional[str], day: date) -> Tuple[datetime, datetime]:
+    """Khoảng [mở cửa, đóng cửa] của ngày `day` dưới dạng datetime."""
+    open_at, close_at = parse_opening_hours(opening_hours)
+    open_dt = datetime.combine(day, open_at)
+    if close_at is None:
+        return open_dt, datetime.combine(day + timedelta(days=1), time.min)
+    return open_dt, datetime.combine(day, close_at)
+
+
+def days_between(start: datetime, end: datetime) -> List[date]:
+    """Các ngày mà khoảng [start, end) chạm tới (end đúng 00:00 không tính ngày đó)."""
+    last = (end - timedelta(microseconds=1)).date() if end > start else start.date()
+    days = []
+    day = start.date()
+    while day <= last:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+class AvailabilityIndex:
+    def __init__(self, max_days: int = AVAILABILITY_MAX_DAYS, ttl: float = AVAILABILITY_TTL_SECONDS):
+        self.max_days = max_days
+        self.ttl = ttl
+        self._days: "OrderedDict[DayKey, DaySchedule]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session, key: DayKey) -> DaySchedule:
+        facility_id, sport_type, court_id, day = key
+        day_start = datetime.combine(day, time.min)
+        day_end = day_start + timedelta(days=1)
+        rows = (
+            db.query(Booking.start_time, Booking.end_time, Booking.id)
+            .filter(
+                Booking.facility_id == facility_id,
+                Booking.sport_type.is_(None) if sport_type is None else Booking.sport_type == sport_type,
+                Booking.court_id == court_id,
+                Booking.start_time < day_end,
+                Booking.end_time > day_start,
+                Booking.status.notin_(RELEASED_STATUSES),
+            )
+            .all()
+        )
+        return DaySchedule([tuple(r) for r in rows])
+
+    def _get(self, db: Session, key: DayKey) -> DaySchedule:
+        with self._lock:
+            schedule = self._days.get(key)
+            if schedule is not None and monotonic() - schedule.loaded_at < self.ttl:
+                self._days.move_to_end(key)
+                return schedule
+
+        schedule = self._load(db, key)
+        with self._lock:
+            self._store(key, schedule)
+        return schedule
+
+    def _store(self, key: DayKey, schedule: DaySchedule):
+        self._days[key] = schedule
+        self._days.move_to_end(key)
+        while len(self._days) > self.max_days:
+            self._days.popitem(last=False)
+
+    def preload(self, db: Session, keys: Iterable[DayKey]):
+        """Nạp các ngày chưa có (hoặc đã hết hạn) bằng một query mỗi ngày cho mọi sân.
+
+        Dùng trước khi gọi is_free cho nhiều sân/court (vd. /nearby) để cache lạnh
+        không tốn một round-trip cho từng court. Lọc bằng tsrange && như constraint
+        bookings_court_no_overlap nên dùng được index GiST của constraint đó.
+        """
+        now = monotonic()
+        missing: Dict[date, List[DayKey]] = {}
+        with self._lock:
+            for key in keys:
+                schedule = self._days.get(key)
+                if schedule is None or now - schedule.loaded_at >= self.ttl:
+                    missing.setdefault(key[3], []).append(key)
+
+        for day, day_keys in missing.items():
+            day_start = datetime.combine(day, time.min)
+            day_end = day_start + timedelta(days=1)
+            facility_ids = sorted({key[0] for key in day_keys})
+            rows = (
+                db.query(
+                    Booking.facility_id, Booking.sport_type, Booking.court_id,
+                    Booking.start_time, Booking.end_time, Booking.id,
+                )
+                .filter(
+                    Booking.facility_id == any_(bindparam("facility_ids", facility_ids, type_=ARRAY(Integer))),
+                    func.tsrange(Booking.start_time, Booking.end_time).op("&&")(func.tsrange(day_start, day_end)),
+                    Booking.status.notin_(RELEASED_STATUSES),
+                )
+                .all()
+            )
+            intervals: Dict[DayKey, List[Tuple[datetime, datetime, int]]] = {key: [] for key in day_keys}
+            for facility_id, sport_type, court_id, start, end, booking_id in rows:
+                found = intervals.get((facility_id, sport_type, court_id, day))
+                if found is not None:
+                    found.append((start, end, booking_id))
+            with self._lock:
+                for key, items in intervals.items():
+                    self._store(key, DaySchedule(items))
+
+    def is_free(
+        self,
+        db: Session,
+        facility_id: int,
+        sport_type: Optional[str],
+        court_id: int,
+        start: datetime,
+        end: datetime,
+    ) -> bool:
+        for day in days_between(start, end):
+            schedule = self._get(db, (facility_id, sport_type, court_id, day))
+            with self._lock:
+                if schedule.overlaps(start, end):
+                    return False
+        return True
+
+    def free_slots(
+        self,
+        db: Session,
+        facility_id: int,
+        sport_type: Optional[str],
+        court_id: int,
+        day: date,
+        opening_hours: Optional[str],
+        slot_minutes: int = SLOT_MINUTES,
+    ) -> List[str]:
+        """Danh sách giờ bắt đầu ("HH:MM") của các slot còn trống trong ngày."""
+        schedule = self._get(db, (facility_id, sport_type, court_id, day))
+        step = timedelta(minutes=slot_minutes)
+        slot_start, close_dt = opening_window(opening_hours, day)
+
+        slots = []
+        with self._lock:
+            while slot_start + step <= close_dt:
+                if not schedule.overlaps(slot_start, slot_start + step):
+                    slots.append(slot_start.strftime("%H:%M"))
+                slot_start += step
+        return slots
+
+    def reserve(self, booking: Booking):
+        """Ghi nhận booking vừa tạo vào mọi ngày nó chiếm (ngày nào đang được cache)."""
+        with self._lock:
+            for day in days_between(booking.start_time, booking.end_time):
+                schedule = self._days.get((booking.facility_id, booking.sport_type, booking.court_id, day))
+                if schedule is not None:
+                    schedule.add(booking.start_time, booking.end_time, booking.id)
+
+    def release(self, booking: Booking):
+        """Trả lại khung giờ của booking bị hủy ở mọi ngày nó chiếm."""
+        with self._lock:
+            for day in days_between(booking.start_time, booking.end_time):
+                schedule = self._days.get((booking.facility_id, booking.sport_type, booking.court_id, day))
+                if schedule is not None:
+                    schedule.remove(booking.id)
+
+    def forget(self, facility_id: int, sport_type: Optional[str], court_id: int, start: datetime, end: datetime):
+        """Bỏ cache các ngày mà [start, end) chạm tới để lần tra cứu sau đọc lại từ DB."""
+        with self._lock:
+            for day in days_between(start, end):
+                self._days.pop((facility_id, sport_type, court_id, day), None)
+
+    def invalidate(self, facility_id: Optional[int] = None):
+        with self._lock:
+            if facility_id is None:
+                self._days.clear()
+                return
+            for key in [k for k in self._days if k[0] == facility_id]:
+                del self._days[key]
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,92 @@
+from datetime import date, timedelta
+import os
+from typing import Optional
+
+from sqlalchemy import func, delete, select, literal, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from models import Booking, BookingDailyStat
+from services.availability import RELEASED_STATUSES
+
+# Số ngày gần nhất được tính lại từ bảng bookings mỗi đêm
+BOOKING_STATS_RECONCILE_DAYS = int(os.getenv("BOOKING_STATS_RECONCILE_DAYS", 7))
+
+def _is_counted(status: Optional[str]) -> bool:
+    return status not in RELEASED_STATUSES
+
+def _apply_delta(db: Session, facility_id: int, day, count_delta: int, revenue_delta: float):
+    stmt = insert(BookingDailyStat).values(
+        facility_id=facility_id,
+        day=day,
+        bookings_count=count_delta,
+        revenue=revenue_delta,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BookingDailyStat.facility_id, BookingDailyStat.day],
+        set_={
+            "bookings_count": BookingDailyStat.bookings_count + stmt.excluded.bookings_count,
+            "revenue": BookingDailyStat.revenue + stmt.excluded.revenue,
+        },
+    )
+    db.execute(stmt)
+
+def record_booking_created(db: Session, booking: Booking):
+    """Cộng booking mới vào rollup, gọi trước commit để cùng transaction với INSERT booking.
+
+    created_at mặc định là now() - thời điểm bắt đầu transaction - nên ngày
+    của rollup cũng lấy theo now() để khớp với reconcile.
+    """
+    if _is_counted(booking.status):
+        _apply_delta(db, booking.facility_id, func.date(func.now()), 1, booking.total_price or 0)
+
+def record_booking_status_change(db: Session, booking: Booking, old_status: Optional[str]):
+    """Cập nhật rollup khi booking chuyển giữa trạng thái được tính và bị hủy."""
+    was_counted, is_counted = _is_counted(old_status), _is_counted(booking.status)
+    if was_counted == is_counted:
+        return
+    sign = 1 if is_counted else -1
+    _apply_delta(
+        db, booking.facility_id, func.date(literal(booking.created_at)),
+        sign, sign * (booking.total_price or 0)
+    )
+
+def reconcile_booking_stats(db: Session, since: Optional[date] = None):
+    """Tính lại rollup từ bảng bookings (toàn bộ nếu since=None) và commit."""
+    day = func.date(Booking.created_at)
+    source = (
+        select(
+            Booking.facility_id,
+            day.label("day"),
+            func.count(Booking.id).label("bookings_count"),
+            func.coalesce(func.sum(Booking.total_price), 0).label("revenue"),
+        )
+        .where(Booking.status.notin_(RELEASED_STATUSES))
+        .group_by(Booking.facility_id, day)
+    )
+    stale = delete(BookingDailyStat)
+    if since is not None:
+        source = source.where(Booking.created_at >= since)
+        stale = stale.where(BookingDailyStat.day >= since)
+
+    # Chặn _apply_delta của các transaction khác tới khi commit: upsert của chúng
+    # (ROW EXCLUSIVE) xung đột với khóa này, nên không có dòng (facility_id, day)
+    # nào được chèn vào giữa DELETE và INSERT, và không mất delta nào đã/đang ghi
+    db.execute(text("LOCK TABLE booking_daily_stats IN SHARE ROW EXCLUSIVE MODE"))
+    db.execute(stale)
+    db.execute(
+        insert(BookingDailyStat).from_select(
+            ["facility_id", "day", "bookings_count", "revenue"], source
+        )
+    )
+    db.commit()
+
+def reconcile_recent_booking_stats(db: Session):
+    since = date.today() - timedelta(days=BOOKING_STATS_RECONCILE_DAYS)
+    reconcile_booking_stats(db, since)
+
+def backfill_booking_stats(db: Session):
+    """Lần đầu triển khai: dựng rollup từ toàn bộ lịch sử nếu bảng còn trống."""
+    has_stats = db.query(BookingDailyStat.facility_id).first() is not None
+    has_bookings = db.query(Booking.id).first() is not None
+    if has_bookings and not has_stats:
+        reconcile_booking_stats(db)
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from database import DATABASE_URL
+
+# "memory": chỉ trong một process (chạy 1 worker)
+# "postgres": LISTEN/NOTIFY, phát tới mọi worker/host dùng chung database
+BROKER_BACKEND = os.getenv("BROKER_BACKEND", "memory")
+BROKER_CHANNEL_PREFIX = os.getenv("BROKER_CHANNEL_PREFIX", "app_")
+# Giới hạn payload của NOTIFY trong PostgreSQL là 8000 byte; message lớn hơn
+# được chia thành nhiều phần và ghép lại ở phía nhận
+PG_NOTIFY_MAX_BYTES = 7900
+# Mỗi phần chứa tối đa chừng này byte JSON gốc (sau khi escape lại vẫn dưới giới hạn)
+PG_NOTIFY_CHUNK_BYTES = (PG_NOTIFY_MAX_BYTES - 200) // 2
+# Bỏ message chia phần chưa nhận đủ sau chừng này giây
+PG_NOTIFY_CHUNK_TIMEOUT_SECONDS = 30
+# Thời gian publish chờ broker kết nối lại trước khi chỉ giao trong worker hiện tại
+BROKER_PUBLISH_WAIT_SECONDS = float(os.getenv("BROKER_PUBLISH_WAIT_SECONDS", 5))
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class Broker(ABC):
+    """Pub/sub giữa các worker: publish(channel, message) tới mọi subscriber của channel."""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        # Event loop của worker, để code đồng bộ (thread pool) publish được
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, channel: str, handler: Handler):
+        self._handlers[channel].append(handler)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, channel: str, message: dict):
+        ...
+
+    def publish_from_sync(self, channel: str, message: dict):
+        """Publish từ code đồng bộ (route sync chạy trong thread pool), không chờ kết quả."""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            in_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            in_loop = False
+        coro = self.publish(channel, message)
+        if in_loop:
+            loop.create_task(coro)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, loop)
+
+    async def _dispatch(self, channel: str, message: dict):
+        for handler in self._handlers.get(channel, []):
+            try:
+                await handler(message)
+            except Exception as e:
+                print(f"❌ Broker handler error on {channel}: {e}")
+
+
+class InMemoryBroker(Broker):
+    async def publish(self, channel: str, message: dict):
+        await self._dispatch(channel, message)
+
+
+def split_utf8(text: str, max_bytes: int) -> List[str]:
+    """Chia chuỗi thành các phần có độ dài UTF-8 không quá max_bytes, không cắt giữa ký tự."""
+    data = text.encode("utf-8")
+    parts = []
+    start = 0
+    while start < len(data):
+        end = min(start + max_bytes, len(data))
+        # Lùi về đầu ký tự nếu đang đứng ở byte tiếp nối (10xxxxxx)
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode("utf-8"))
+        start = end
+    return parts
+
+
+class PostgresBroker(Broker):
+    """Dùng LISTEN/NOTIFY: một kết nối asyncpg riêng để LISTEN, một kết nối để NOTIFY."""
+
+    def __init__(self, dsn: str = DATABASE_URL, prefix: str = BROKER_CHANNEL_PREFIX):
+        super().__init__()
+        self.dsn = dsn
+        self.prefix = prefix
+        self._listen_conn = None
+        self._notify_conn = None
+        self._notify_lock = asyncio.Lock()
+        self._connected = asyncio.Event()
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closing = False
+        # message đang nhận dở: id -> (thời điểm nhận phần đầu, các phần)
+        self._partial: Dict[str, tuple] = {}
+
+    def subscribe(self, channel: str, handler: Handler):
+        is_new_channel = channel not in self._handlers
+        super().subscribe(channel, handler)
+        # Channel đăng ký sau khi đã start: LISTEN thêm trên kết nối hiện có
+        if is_new_channel and self._listen_conn is not None:
+            asyncio.get_running_loop().create_task(
+                self._listen_conn.add_listener(self.prefix + channel, self._on_notify)
+            )
+
+    async def start(self):
+        await super().start()
+        self._closing = False
+        await self._connect()
+
+    async def _connect(self):
+        import asyncpg
+
+        self._listen_conn = await asyncpg.connect(self.dsn)
+        self._notify_conn = await asyncpg.connect(self.dsn)
+        for channel in self._handlers:
+            await self._listen_conn.add_listener(self.prefix + channel, self._on_notify)
+        self._listen_conn.add_termination_listener(self._on_terminated)
+        self._notify_conn.add_termination_listener(self._on_terminated)
+        self._connected.set()
+
+    def _on_terminated(self, _conn):
+        self._connected.clear()
+        if not self._closing and self._reconnect_task is None:
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 1
+        while not self._closing:
+            try:
+                await self._close_connections()
+                await self._connect()
+                print("✅ Broker reconnected")
+                break
+            except Exception as e:
+                print(f"❌ Broker reconnect failed: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+        self._reconnect_task = None
+
+    async def _close_connections(self):
+        self._connected.clear()
+        listen_conn, notify_conn = self._listen_conn, self._notify_conn
+        self._listen_conn = self._notify_conn = None
+        for conn in (listen_conn, notify_conn):
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+
+    async def stop(self):
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        await self._close_connections()
+
+    def _on_notify(self, _conn, pg_channel: str, payload: str):
+        channel = pg_channel[len(self.prefix):]
+        message = json.loads(payload)
+        if "_chunk" in message:
+            message = self._collect_chunk(*message["_chunk"])
+            if message is None:
+                return
+        asyncio.get_running_loop().create_task(self._dispatch(channel, message))
+
+    def _collect_chunk(self, message_id: str, index: int, total: int, data: str) -> Optional[dict]:
+        now = monotonic()
+        for stale in [k for k, (started, _) in self._partial.items()
+                      if now - started > PG_NOTIFY_CHUNK_TIMEOUT_SECONDS]:
+            del self._partial[stale]
+        started, parts = self._partial.setdefault(message_id, (now, [None] * total))
+        parts[index] = data
+        if any(part is None for part in parts):
+            return None
+        del self._partial[message_id]
+        return json.loads("".join(parts))
+
+    async def _wait_connected(self) -> bool:
+        if self._connected.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self._connected.wait(), BROKER_PUBLISH_WAIT_SECONDS)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def publish(self, channel: str, message: dict):
+        payload = json.dumps(message, default=str, ensure_ascii=False)
+        if len(payload.encode("utf-8")) <= PG_NOTIFY_MAX_BYTES:
+            payloads = [payload]
+        else:
+            message_id = uuid.uuid4().hex
+            parts = split_utf8(payload, PG_NOTIFY_CHUNK_BYTES)
+            payloads = [
+                json.dumps({"_chunk": [message_id, i, len(parts), part]}, ensure_ascii=False)
+                for i, part in enumerate(parts)
+            ]
+
+        if await self._wait_connected():
+            try:
+                async with self._notify_lock:
+                    # Các NOTIFY từ cùng một kết nối tới nơi nhận theo đúng thứ tự gửi
+                    for item in payloads:
+                        await self._notify_conn.execute("SELECT pg_notify($1, $2)", self.prefix + channel, item)
+                return
+            except Exception as e:
+                print(f"❌ Broker publish error on {channel}: {e}")
+                self._on_terminated(None)
+        # Mất kết nối tới Postgres: ít nhất vẫn giao cho subscriber trong worker này
+        print(f"⚠️ Broker chưa kết nối, chỉ giao {channel} trong worker hiện tại")
+        await self._dispatch(channel, message)
+
+
+def create_broker(backend: str = BROKER_BACKEND) -> Broker:
+    if backend == "postgres":
+        return PostgresBroker()
+    if backend == "memory":
+        return InMemoryBroker()
+    raise ValueError(f"BROKER_BACKEND không hợp lệ: {backend}")
+
+
+broker = create_broker()
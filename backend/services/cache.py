@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, NamedTuple, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from services.broker import Broker, broker
+
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", 300))
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", 1024))
+# Kết quả /search (mỗi tổ hợp q/bộ lọc/cursor một entry) nằm riêng để tìm kiếm
+# tự do không đẩy danh sách/chi tiết sân đang được đọc nhiều ra khỏi cache
+CATALOG_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_SEARCH_CACHE_MAX_ENTRIES", 256))
+
+
+class TTLCache:
+    """LRU cache trong process, mỗi entry hết hạn sau `ttl` giây. An toàn với thread."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Tăng mỗi lần delete()/clear(); giá trị build trước đó sẽ không được lưu
+        self.generation = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+            self.generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class CatalogCache:
+    """Cache JSON đã render của các endpoint danh mục sân, kèm ETag.
+
+    Khi dữ liệu sân thay đổi, invalidate() xóa cache ở worker hiện tại và phát
+    qua broker để các worker khác cũng xóa.
+    """
+
+    channel = "catalog_invalidate"
+
+    def __init__(self, broker: Broker = broker, ttl: float = CATALOG_CACHE_TTL_SECONDS,
+                 max_entries: int = CATALOG_CACHE_MAX_ENTRIES,
+                 search_max_entries: int = CATALOG_SEARCH_CACHE_MAX_ENTRIES):
+        self.broker = broker
+        self._partitions = {
+            "default": TTLCache(ttl, max_entries),
+            "search": TTLCache(ttl, search_max_entries),
+        }
+        broker.subscribe(self.channel, self._on_invalidate)
+
+    def get_or_build(self, key: str, build: Callable[[], Any], partition: str = "default") -> CachedResponse:
+        cache = self._partitions[partition]
+        entry = cache.get(key)
+        if entry is None:
+            generation = cache.generation
+            body = json.dumps(
+                jsonable_encoder(build()), ensure_ascii=False, separators=(",", ":")
+            ).encode("utf-8")
+            entry = CachedResponse(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+            cache.set(key, entry, generation)
+        return entry
+
+    def clear_local(self):
+        for cache in self._partitions.values():
+            cache.clear()
+
+    async def invalidate(self):
+        self.clear_local()
+        try:
+            await self.broker.publish(self.channel, {})
+        except Exception as e:
+            print(f"❌ Catalog cache invalidation publish error: {e}")
+
+    async def _on_invalidate(self, _message: dict):
+        self.clear_local()
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def cached_json_response(
+    request: Request, key: str, build: Callable[[], Any], partition: str = "default"
+) -> Response:
+    """Trả JSON từ catalog cache; 304 nếu client đã có đúng phiên bản (If-None-Match)."""
+    entry = catalog_cache.get_or_build(key, build, partition)
+    # no-cache: trình duyệt vẫn lưu nhưng luôn hỏi lại bằng ETag
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,146 @@
+import asyncio
+import os
+from datetime import datetime
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from database import AsyncSessionLocal
+from models import Message, User
+
+# Gom tin nhắn trong tối đa CHAT_BATCH_INTERVAL_MS rồi ghi một lần (multi-row INSERT)
+CHAT_BATCH_INTERVAL_MS = int(os.getenv("CHAT_BATCH_INTERVAL_MS", 5))
+CHAT_BATCH_MAX_SIZE = int(os.getenv("CHAT_BATCH_MAX_SIZE", 500))
+CHAT_QUEUE_MAX_SIZE = int(os.getenv("CHAT_QUEUE_MAX_SIZE", 10000))
+RECEIVER_CACHE_TTL_SECONDS = int(os.getenv("RECEIVER_CACHE_TTL_SECONDS", 300))
+RECEIVER_CACHE_MAX_SIZE = 100_000
+
+SavedMessage = Tuple[int, datetime]
+
+# Đưa vào hàng đợi khi stop(): task nền ghi nốt batch đang gom rồi tự kết thúc
+_STOP = object()
+
+
+class ReceiverCache:
+    """Nhớ các user id đã xác nhận tồn tại để không query DB cho mỗi tin nhắn."""
+
+    def __init__(self, ttl: float = RECEIVER_CACHE_TTL_SECONDS, max_size: int = RECEIVER_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._known: Dict[int, float] = {}
+
+    async def exists(self, user_id: int) -> bool:
+        expires_at = self._known.get(user_id)
+        if expires_at is not None and expires_at > monotonic():
+            return True
+
+        async with AsyncSessionLocal() as db:
+            found = (await db.execute(select(User.id).where(User.id == user_id))).first() is not None
+
+        # Chỉ cache kết quả "có tồn tại"; user chưa có có thể được tạo sau đó
+        if found:
+            if len(self._known) >= self.max_size:
+                self._known.clear()
+            self._known[user_id] = monotonic() + self.ttl
+        return found
+
+    def forget(self, user_id: int):
+        self._known.pop(user_id, None)
+
+
+class ChatWriter:
+    """Hàng đợi ghi tin nhắn: một task nền gom tin nhắn và batch-insert vào DB.
+
+    `save()` trả về Future nhận (id, created_at) sau khi tin nhắn được ghi.
+    """
+
+    def __init__(
+        self,
+        interval_ms: int = CHAT_BATCH_INTERVAL_MS,
+        max_batch: int = CHAT_BATCH_MAX_SIZE,
+        max_queue: int = CHAT_QUEUE_MAX_SIZE,
+    ):
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Dừng task nền và ghi nốt các tin nhắn còn trong hàng đợi."""
+        if self._task is None:
+            return
+        # Không cancel: tin nhắn đã lấy khỏi hàng đợi vào batch sẽ bị mất
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+        # Tin nhắn được save() sau khi đã gửi _STOP
+        remaining = []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        for i in range(0, len(remaining), self.max_batch):
+            await self._flush(remaining[i:i + self.max_batch])
+
+    async def save(self, sender_id: int, receiver_id: int, content: str) -> "asyncio.Future[SavedMessage]":
+        future = asyncio.get_running_loop().create_future()
+        values = {"sender_id": sender_id, "receiver_id": receiver_id, "content": content}
+        # Hàng đợi đầy thì chờ (backpressure lên websocket của người gửi)
+        await self._queue.put((values, future))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + self.interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[tuple]):
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    insert(Message).returning(
+                        Message.id, Message.created_at, sort_by_parameter_order=True
+                    ),
+                    [values for values, _ in batch],
+                )
+                rows = result.all()
+                await db.commit()
+        except Exception as e:
+            print(f"❌ Chat batch insert error ({len(batch)} messages): {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), row in zip(batch, rows):
+            if not future.done():
+                future.set_result((row.id, row.created_at))
+
+
+receiver_cache = ReceiverCache()
+chat_writer = ChatWriter()
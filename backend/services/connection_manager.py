@@ -1,20 +1,130 @@
+import asyncio
+import os
 from typing import Dict, List
 from fastapi import WebSocket
+from services.broker import Broker, broker
+
+# Số tin nhắn tối đa chờ gửi trên mỗi socket; đầy nghĩa là client quá chậm
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", 100))
+# Thời gian tối đa cho một lần gửi trước khi coi client là bị treo
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", 5))
+# Mã đóng websocket khi loại client chậm (1013 = Try Again Later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class ClientConnection:
+    """Một websocket với hàng đợi gửi riêng và task gửi riêng.
+
+    Gửi cho user chỉ là đưa vào hàng đợi (không chờ), nên một client treo
+    không làm chậm việc gửi cho các client khác.
+    """
+
+    def __init__(self, manager: "ConnectionManager", user_id: int, websocket: WebSocket):
+        self.manager = manager
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.sender = asyncio.create_task(self._send_loop())
+
+    def enqueue(self, message: dict) -> bool:
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _send_loop(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_json(message), WS_SEND_TIMEOUT_SECONDS)
+                self.manager.stats["sent"] += 1
+            except Exception:
+                self.manager.stats["dropped_sends"] += 1 + self.queue.qsize()
+                await self.manager.evict(self)
+                return
+
+    async def close(self, code: int):
+        if self.sender is not asyncio.current_task():
+            self.sender.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
+    """Quản lý websocket của các user trên worker hiện tại.
+
+    Tin nhắn gửi qua broker nên tới được user đang kết nối ở worker/host khác;
+    mỗi worker nhận từ broker và gửi cho mọi socket (điện thoại, laptop, ...)
+    của user trên chính nó.
+    """
+
+    instances: List["ConnectionManager"] = []
+
+    def __init__(self, channel: str, broker: Broker = broker):
+        self.channel = channel
+        self.broker = broker
+        self.active_connections: Dict[int, Dict[WebSocket, ClientConnection]] = {}
+        self.stats = {"sent": 0, "dropped_sends": 0, "evicted": 0}
+        broker.subscribe(channel, self._on_broker_message)
+        ConnectionManager.instances.append(self)
 
     async def connect(self, user_id: int, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        client = ClientConnection(self, user_id, websocket)
+        self.active_connections.setdefault(user_id, {})[websocket] = client
+
+    def _remove(self, user_id: int, websocket: WebSocket):
+        clients = self.active_connections.get(user_id)
+        if not clients:
+            return None
+        client = clients.pop(websocket, None)
+        if not clients:
+            self.active_connections.pop(user_id, None)
+        return client
+
+    def disconnect(self, user_id: int, websocket: WebSocket):
+        client = self._remove(user_id, websocket)
+        if client is not None:
+            client.sender.cancel()
 
-    def disconnect(self, user_id: int):
-        self.active_connections.pop(user_id, None)
+    async def evict(self, client: ClientConnection):
+        """Loại client chậm/treo: bỏ khỏi danh sách và đóng socket."""
+        if self._remove(client.user_id, client.websocket) is None:
+            return
+        self.stats["evicted"] += 1
+        await client.close(SLOW_CONSUMER_CLOSE_CODE)
 
     async def send_personal_message(self, message: dict, user_id: int):
-        websocket = self.active_connections.get(user_id)
-        if websocket:
-            await websocket.send_json(message)
+        await self.broker.publish(self.channel, {"user_id": user_id, "message": message})
+
+    def send_from_sync(self, message: dict, user_id: int):
+        """Gửi từ code đồng bộ (route sync chạy trong thread pool), không chờ kết quả."""
+        self.broker.publish_from_sync(self.channel, {"user_id": user_id, "message": message})
+
+    async def _on_broker_message(self, envelope: dict):
+        await self.deliver_local(envelope["message"], envelope["user_id"])
+
+    async def deliver_local(self, message: dict, user_id: int):
+        clients = list(self.active_connections.get(user_id, {}).values())
+        slow = [client for client in clients if not client.enqueue(message)]
+        if slow:
+            self.stats["dropped_sends"] += len(slow)
+            await asyncio.gather(*(self.evict(client) for client in slow))
+
+    def metrics(self) -> dict:
+        clients = [c for per_user in self.active_connections.values() for c in per_user.values()]
+        depths = [c.queue.qsize() for c in clients]
+        return {
+            "channel": self.channel,
+            "connected_users": len(self.active_connections),
+            "connected_sockets": len(clients),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            **self.stats,
+        }
 
-manager = ConnectionManager()
+manager = ConnectionManager("chat")
+notification_manager = ConnectionManager("notifications")
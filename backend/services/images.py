@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from services.processes import process_context
+from services.storage import storage
+
+# Các bản WebP sinh ra khi upload ảnh sân: tên -> cạnh dài tối đa (px)
+IMAGE_VARIANTS = {"thumb": 320, "medium": 800, "large": 1600}
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", 80))
+# Resize ảnh tốn CPU nên chạy ở process riêng, không giữ GIL của worker
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+
+_pool: Optional[ProcessPoolExecutor] = None
+# Key của các bản WebP đã xác nhận có trong storage (chỉ nhớ kết quả "có")
+_stored_variants: Set[str] = set()
+STORED_VARIANTS_MAX_SIZE = 100_000
+
+
+def variant_path(path: str, name: str) -> str:
+    """abc.jpg -> abc_thumb.webp (dùng cho cả đường dẫn file tạm lẫn key trong storage)."""
+    return f"{os.path.splitext(path)[0]}_{name}.webp"
+
+
+def _render_variants(path: str, quality: int = IMAGE_WEBP_QUALITY) -> Dict[str, str]:
+    """Chạy trong process pool: đọc ảnh gốc một lần, ghi từng bản WebP."""
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as original:
+        # Ảnh chụp điện thoại thường xoay bằng EXIF
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+        variants = {}
+        for name, size in IMAGE_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            target = variant_path(path, name)
+            resized.save(target + ".part", "WEBP", quality=quality, method=4)
+            os.replace(target + ".part", target)
+            variants[name] = target
+        return variants
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=process_context())
+    return _pool
+
+
+async def generate_variants(path: str) -> Dict[str, str]:
+    """Sinh các bản WebP cạnh file ảnh local `path`; file không phải ảnh thì bỏ qua."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), _render_variants, path)
+    except Exception as e:
+        print(f"❌ Image variants error for {path}: {e}")
+        return {}
+
+
+def shutdown_image_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def _variant_stored(key: str) -> bool:
+    # Key theo nội dung không đổi nên "có" thì cache được mãi; "chưa có" thì hỏi lại
+    # storage lần sau vì bản WebP có thể được sinh sau đó
+    if key in _stored_variants:
+        return True
+    if not storage.exists(key):
+        return False
+    if len(_stored_variants) >= STORED_VARIANTS_MAX_SIZE:
+        _stored_variants.clear()
+    _stored_variants.add(key)
+    return True
+
+
+def has_all_variants(key: str) -> bool:
+    """Storage đã có đủ các bản WebP của key chưa (gọi storage, chạy trong thread)."""
+    return all(_variant_stored(variant_path(key, name)) for name in IMAGE_VARIANTS)
+
+
+def image_variants(url: Optional[str]) -> Dict[str, str]:
+    """URL các bản WebP đã có của một ảnh (ảnh cũ hoặc ảnh ngoài storage thì rỗng)."""
+    key = storage.key_from_url(url) if url else None
+    if not key:
+        return {}
+    variants = {}
+    for name in IMAGE_VARIANTS:
+        candidate = variant_path(key, name)
+        if _variant_stored(candidate):
+            variants[name] = storage.url(candidate)
+    return variants
+
+
+def parse_images(images: Optional[str]) -> List[str]:
+    """Cột Facility.images lưu danh sách đường dẫn dạng JSON."""
+    if not images:
+        return []
+    try:
+        paths = json.loads(images)
+    except ValueError:
+        return []
+    return paths if isinstance(paths, list) else []
@@ -0,0 +1,56 @@
+import asyncio
+import zlib
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine
+
+def job_lock_id(job: Callable) -> int:
+    """Khóa advisory riêng cho từng job (ổn định giữa các worker và các lần chạy)."""
+    return zlib.crc32(f"job:{job.__module__}.{job.__name__}".encode())
+
+def run_with_session(job: Callable[[Session], None]):
+    # Mỗi worker uvicorn đều lên lịch job: chỉ worker lấy được khóa mới chạy.
+    # Khóa giữ trên kết nối riêng vì Session trả kết nối về pool sau mỗi commit
+    lock_id = job_lock_id(job)
+    with engine.connect() as lock_conn:
+        acquired = lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": lock_id}).scalar()
+        # Khóa advisory cấp session vẫn giữ sau commit; không để kết nối "idle in transaction"
+        lock_conn.commit()
+        if not acquired:
+            print(f"⏭️ Job {job.__name__} đang chạy ở worker khác, bỏ qua")
+            return
+        try:
+            db = SessionLocal()
+            try:
+                job(db)
+            finally:
+                db.close()
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+            lock_conn.commit()
+
+async def run_job(job: Callable[[Session], None]):
+    """Chạy job đồng bộ (nhận Session) trong thread pool để không chặn event loop."""
+    try:
+        await asyncio.to_thread(run_with_session, job)
+    except Exception as e:
+        print(f"❌ Job {job.__name__} error: {e}")
+
+async def run_daily(job: Callable[[Session], None], hour: int = 3, minute: int = 0):
+    """Chạy job mỗi ngày vào giờ:phút (giờ server)."""
+    while True:
+        now = datetime.now()
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        await run_job(job)
+
+async def run_every(job: Callable[[Session], None], seconds: float):
+    """Chạy job lặp lại sau mỗi khoảng `seconds`."""
+    while True:
+        await asyncio.sleep(seconds)
+        await run_job(job)
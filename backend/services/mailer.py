@@ -0,0 +1,253 @@
+import asyncio
+import html
+import os
+import smtplib
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from string import Template
+from typing import Optional
+
+FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+# false khi gửi tới SMTP sink local (vd. python -m aiosmtpd -n -l localhost:1025)
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", 10))
+FROM_EMAIL = os.getenv("FROM_EMAIL", SMTP_USER)
+
+# Số kết nối SMTP gửi song song (mỗi kết nối một task, dùng lại giữa các email)
+EMAIL_CONCURRENCY = int(os.getenv("EMAIL_CONCURRENCY", 1))
+EMAIL_QUEUE_MAX_SIZE = int(os.getenv("EMAIL_QUEUE_MAX_SIZE", 1000))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+# Đóng kết nối sau khoảng rảnh này (server SMTP thường tự ngắt kết nối idle)
+EMAIL_IDLE_SECONDS = float(os.getenv("EMAIL_IDLE_SECONDS", 60))
+EMAIL_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("EMAIL_SHUTDOWN_TIMEOUT_SECONDS", 10))
+
+RESET_PASSWORD_SUBJECT = "🔐 Đặt lại mật khẩu - Hệ thống của bạn"
+# Template HTML được parse một lần khi import, mỗi email chỉ thay biến
+RESET_PASSWORD_TEMPLATE = Template("""\
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Đặt lại mật khẩu</title>
+</head>
+<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; text-align: center; border-radius: 10px 10px 0 0;">
+        <h1 style="color: white; margin: 0; font-size: 28px;">🔐 Đặt lại mật khẩu</h1>
+    </div>
+    
+    <div style="background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px;">
+        <h2 style="color: #333; margin-top: 0;">Xin chào$greeting_name!</h2>
+        
+        <p>Bạn đã yêu cầu đặt lại mật khẩu cho tài khoản của mình.</p>
+        
+        <p>Vui lòng nhấp vào nút bên dưới để đặt lại mật khẩu:</p>
+        
+        <div style="text-align: center; margin: 30px 0;">
+            <a href="$reset_url" 
+               style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
+                      color: white; 
+                      padding: 15px 30px; 
+                      text-decoration: none; 
+                      border-radius: 8px; 
+                      display: inline-block; 
+                      font-weight: bold;
+                      font-size: 16px;">
+                Đặt lại mật khẩu
+            </a>
+        </div>
+        
+        <div style="background: #fff3cd; border: 1px solid #ffeaa7; border-radius: 8px; padding: 15px; margin: 20px 0;">
+            <h3 style="color: #856404; margin: 0 0 10px 0; font-size: 16px;">⚠️ Lưu ý quan trọng:</h3>
+            <ul style="margin: 0; padding-left: 20px; color: #856404;">
+                <li>Liên kết này có hiệu lực trong <strong>15 phút</strong></li>
+                <li>Chỉ sử dụng được <strong>một lần</strong></li>
+                <li>Không chia sẻ liên kết này với bất kỳ ai</li>
+                <li>Nếu bạn không yêu cầu, vui lòng bỏ qua email này</li>
+            </ul>
+        </div>
+        
+        <div style="background: #d1ecf1; border: 1px solid #bee5eb; border-radius: 8px; padding: 15px; margin: 20px 0;">
+            <h3 style="color: #0c5460; margin: 0 0 10px 0; font-size: 16px;">🛡️ Bảo mật tài khoản:</h3>
+            <ul style="margin: 0; padding-left: 20px; color: #0c5460; font-size: 14px;">
+                <li>Sử dụng mật khẩu mạnh (ít nhất 8 ký tự)</li>
+                <li>Kết hợp chữ hoa, chữ thường, số và ký tự đặc biệt</li>
+                <li>Không sử dụng mật khẩu này cho tài khoản khác</li>
+                <li>Đăng xuất khi sử dụng máy tính chung</li>
+            </ul>
+        </div>
+        
+        <p style="color: #666; font-size: 14px; margin-top: 30px;">
+            Nếu nút không hoạt động, bạn có thể copy và paste liên kết sau vào trình duyệt:
+            <br>
+            <a href="$reset_url" style="color: #667eea; word-break: break-all;">$reset_url</a>
+        </p>
+        
+        <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
+        
+        <p style="color: #999; font-size: 12px; text-align: center; margin: 0;">
+            © 2025 Hệ thống của bạn. Tất cả quyền được bảo lưu.
+            <br>
+            Email này được gửi tự động, vui lòng không trả lời.
+        </p>
+    </div>
+</body>
+</html>
+""")
+
+
+def render_reset_password_email(email: str, reset_token: str, user_name: Optional[str] = None) -> MIMEMultipart:
+    reset_url = html.escape(f"{FRONTEND_URL}/reset-password/{reset_token}")
+    html_content = RESET_PASSWORD_TEMPLATE.substitute(
+        greeting_name=" " + html.escape(user_name) if user_name else "",
+        reset_url=reset_url,
+    )
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = RESET_PASSWORD_SUBJECT
+    msg["From"] = FROM_EMAIL
+    msg["To"] = email
+    msg.attach(MIMEText(html_content, "html", "utf-8"))
+    return msg
+
+
+# Lỗi do chính email (địa chỉ sai, bị từ chối): gửi lại cũng không được
+PERMANENT_SMTP_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+
+
+class SmtpConnection:
+    """Một kết nối SMTP đã STARTTLS/login, giữ lại cho các email sau. Chỉ dùng trong thread."""
+
+    def __init__(self):
+        self._server: Optional[smtplib.SMTP] = None
+
+    def send(self, msg: MIMEMultipart):
+        if self._server is None:
+            self._server = self._connect()
+        try:
+            self._server.send_message(msg)
+        except PERMANENT_SMTP_ERRORS:
+            raise
+        except Exception:
+            # Kết nối có thể đã hỏng: bỏ đi, lần thử sau kết nối lại
+            self.close()
+            raise
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS)
+        try:
+            if SMTP_USE_TLS:
+                server.starttls()
+            if SMTP_USER and SMTP_PASSWORD:
+                server.login(SMTP_USER, SMTP_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+
+
+class EmailOutbox:
+    """Hàng đợi email gửi đi: request chỉ đưa email vào hàng đợi rồi trả về ngay.
+
+    Mỗi task gửi giữ một kết nối SMTP riêng và chạy lệnh SMTP (blocking) trong
+    thread pool; lỗi tạm thời được gửi lại với backoff tăng dần.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = EMAIL_CONCURRENCY,
+        max_queue: int = EMAIL_QUEUE_MAX_SIZE,
+        max_attempts: int = EMAIL_MAX_ATTEMPTS,
+    ):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self.stats = {"sent": 0, "failed": 0, "retried": 0, "dropped": 0}
+
+    def start(self):
+        if not self._tasks:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """Chờ gửi nốt email trong hàng đợi (tối đa EMAIL_SHUTDOWN_TIMEOUT_SECONDS) rồi dừng."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), EMAIL_SHUTDOWN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"❌ Email outbox: bỏ {self._queue.qsize()} email chưa gửi khi tắt")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def send(self, msg: MIMEMultipart) -> bool:
+        """Đưa email vào hàng đợi; False nếu hàng đợi đầy hoặc outbox chưa chạy."""
+        if self._queue is None:
+            print(f"❌ Email outbox chưa khởi động, bỏ email tới {msg['To']}")
+            return False
+        try:
+            self._queue.put_nowait(msg)
+            return True
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            print(f"❌ Email outbox đầy, bỏ email tới {msg['To']}")
+            return False
+
+    async def _run(self):
+        connection = SmtpConnection()
+        try:
+            while True:
+                try:
+                    msg = await asyncio.wait_for(self._queue.get(), EMAIL_IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    await asyncio.to_thread(connection.close)
+                    continue
+                try:
+                    await self._deliver(connection, msg)
+                finally:
+                    self._queue.task_done()
+        finally:
+            connection.close()
+
+    async def _deliver(self, connection: SmtpConnection, msg: MIMEMultipart):
+        delay = 1
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await asyncio.to_thread(connection.send, msg)
+                self.stats["sent"] += 1
+                print(f"Email sent to: {msg['To']}")
+                return
+            except PERMANENT_SMTP_ERRORS as e:
+                print(f"❌ Email to {msg['To']} rejected: {e}")
+                break
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    print(f"❌ Email to {msg['To']} failed after {attempt} attempts: {e}")
+                    break
+                self.stats["retried"] += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+        self.stats["failed"] += 1
+
+
+email_outbox = EmailOutbox()
+
+
+def send_reset_password_email(email: str, reset_token: str, user_name: Optional[str] = None) -> bool:
+    """Đưa email reset password vào hàng đợi gửi."""
+    return email_outbox.send(render_reset_password_email(email, reset_token, user_name))
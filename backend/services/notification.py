@@ -1,24 +1,180 @@
-from sqlalchemy.orm import Session
+import asyncio
+import os
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import insert
+from database import AsyncSessionLocal
 from models import Notification
+from services.connection_manager import notification_manager
+
+# Tiêu đề notification tạo mỗi lần đăng nhập (job dọn dẹp gộp các bản ghi này)
+LOGIN_NOTIFICATION_TITLE = "Đăng nhập thành công"
+
+# Notification kiểu audit (đăng nhập, kết quả duyệt) được gom lại và ghi mỗi
+# NOTIFICATION_FLUSH_INTERVAL_MS, hoặc sớm hơn khi đủ NOTIFICATION_BATCH_MAX_SIZE
+NOTIFICATION_FLUSH_INTERVAL_MS = int(os.getenv("NOTIFICATION_FLUSH_INTERVAL_MS", 500))
+NOTIFICATION_BATCH_MAX_SIZE = int(os.getenv("NOTIFICATION_BATCH_MAX_SIZE", 500))
+# Số notification tối đa chờ ghi; vượt quá thì bỏ notification mới (chỉ log)
+NOTIFICATION_MAX_PENDING = int(os.getenv("NOTIFICATION_MAX_PENDING", 20000))
+# Batch ghi lỗi được thử lại ở lần flush sau; quá số lần này thì ghi từng dòng rồi bỏ dòng lỗi
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 5))
+
+# (giá trị INSERT, số lần đã ghi lỗi)
+PendingNotification = Tuple[dict, int]
+
+def serialize_notification(notification: Notification) -> dict:
+    return {
+        "id": notification.id,
+        "user_id": notification.user_id,
+        "type": notification.type,
+        "title": notification.title,
+        "message": notification.message,
+        "timestamp": notification.timestamp.isoformat() if notification.timestamp else None,
+        "read": notification.read,
+        "priority": notification.priority,
+        "data": notification.data,
+    }
+
+def notification_event(notification: Notification) -> dict:
+    return {"type": "notification", "notification": serialize_notification(notification)}
+
+
+class NotificationSink:
+    """Ghi notification ở nền: emit() chỉ đưa vào bộ đệm, task nền batch-insert rồi push websocket.
+
+    emit() gọi được từ cả route async lẫn route sync (thread pool).
+    Notification chưa ghi sẽ mất nếu process bị kill (stop() ghi nốt khi shutdown bình thường).
+    """
+
+    def __init__(
+        self,
+        interval_ms: int = NOTIFICATION_FLUSH_INTERVAL_MS,
+        max_batch: int = NOTIFICATION_BATCH_MAX_SIZE,
+        max_pending: int = NOTIFICATION_MAX_PENDING,
+        max_attempts: int = NOTIFICATION_MAX_ATTEMPTS,
+    ):
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.dropped = 0
+        self._pending: List[PendingNotification] = []
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Dừng task nền và ghi nốt các notification còn trong bộ đệm."""
+        if self._task is None:
+            return
+        # Không cancel: batch đang ghi dở sẽ bị mất. Báo dừng và chờ task flush xong
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+        # Notification emit() trong lúc flush cuối, và batch lỗi còn lượt thử lại
+        while self._pending:
+            await self._flush_pending()
+
+    def emit(
+        self,
+        user_id: int,
+        type: str,
+        title: str,
+        message: str,
+        priority: str = "medium",
+        data: dict = None
+    ) -> bool:
+        values = {
+            "user_id": user_id,
+            "type": type,
+            "title": title,
+            "message": message,
+            "priority": priority,
+            "data": data or {},
+            # Giữ thời điểm xảy ra sự kiện, không phải lúc được ghi
+            "timestamp": datetime.now(timezone.utc),
+        }
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                dropped = self.dropped
+                full = True
+            else:
+                self._pending.append((values, 0))
+                full = False
+                wake = len(self._pending) >= self.max_batch
+        if full:
+            if dropped == 1 or dropped % 1000 == 0:
+                print(f"⚠️ Notification sink đầy, đã bỏ {dropped} notification")
+            return False
+        if wake and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush_pending()
+
+    async def _flush_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for i in range(0, len(pending), self.max_batch):
+            await self._flush(pending[i:i + self.max_batch])
+
+    def _requeue(self, batch: List[PendingNotification]):
+        """Đưa batch ghi lỗi về đầu bộ đệm để thử lại (trong giới hạn max_pending)."""
+        with self._lock:
+            room = max(self.max_pending - len(self._pending), 0)
+            self._pending[:0] = [(values, attempts + 1) for values, attempts in batch[:room]]
+            self.dropped += len(batch) - min(room, len(batch))
+
+    async def _flush(self, batch: List[PendingNotification]):
+        try:
+            async with AsyncSessionLocal() as db:
+                notifications = (await db.scalars(
+                    insert(Notification).returning(Notification, sort_by_parameter_order=True),
+                    [values for values, _ in batch],
+                )).all()
+                await db.commit()
+        except Exception as e:
+            attempts = max(attempts for _, attempts in batch) + 1
+            print(f"❌ Notification batch insert error ({len(batch)} notifications, lần {attempts}): {e}")
+            if attempts < self.max_attempts:
+                self._requeue(batch)
+            elif len(batch) > 1:
+                # Có thể chỉ một dòng lỗi (vd. user đã bị xóa): ghi từng dòng, chỉ bỏ dòng lỗi
+                for item in batch:
+                    await self._flush([item])
+            else:
+                self.dropped += 1
+                print(f"⚠️ Bỏ notification cho user {batch[0][0]['user_id']} sau {attempts} lần ghi lỗi")
+            return
+
+        for notification in notifications:
+            try:
+                await notification_manager.send_personal_message(
+                    notification_event(notification), notification.user_id
+                )
+            except Exception as e:
+                print(f"❌ Notification push error to user {notification.user_id}: {e}")
+
 
-def create_notification(
-    db: Session,
-    user_id: int,
-    type: str,
-    title: str,
-    message: str,
-    priority: str = "medium",
-    data: dict = None
-):
-    notification = Notification(
-        user_id=user_id,
-        type=type,
-        title=title,
-        message=message,
-        priority=priority,
-        data=data or {}
-    )
-    db.add(notification)
-    db.commit()
-    db.refresh(notification)
-    return notification
\ No newline at end of file
+notification_sink = NotificationSink()
@@ -0,0 +1,84 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from models import Notification
+from services.notification import LOGIN_NOTIFICATION_TITLE
+
+# Xóa notification đã đọc cũ hơn số ngày này
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 90))
+# Mỗi user chỉ giữ lại N notification đăng nhập gần nhất
+LOGIN_NOTIFICATIONS_KEEP = int(os.getenv("LOGIN_NOTIFICATIONS_KEEP", 5))
+# Xóa theo từng đợt để không giữ lock/transaction quá lâu
+NOTIFICATION_RETENTION_BATCH_SIZE = int(os.getenv("NOTIFICATION_RETENTION_BATCH_SIZE", 5000))
+
+def _delete_in_batches(db: Session, ids_query, batch_size: int) -> int:
+    total = 0
+    while True:
+        batch = ids_query.limit(batch_size).scalar_subquery()
+        deleted = db.execute(
+            delete(Notification).where(Notification.id.in_(batch)),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        db.commit()
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+def _delete_ids(db: Session, ids, batch_size: int) -> int:
+    """Xóa theo danh sách id đã tính sẵn, mỗi đợt batch_size dòng."""
+    total = 0
+    for i in range(0, len(ids), batch_size):
+        total += db.execute(
+            delete(Notification).where(Notification.id.in_(ids[i:i + batch_size])),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        db.commit()
+    return total
+
+def purge_read_notifications(
+    db: Session,
+    retention_days: int = NOTIFICATION_RETENTION_DAYS,
+    batch_size: int = NOTIFICATION_RETENTION_BATCH_SIZE,
+) -> int:
+    """Xóa notification đã đọc cũ hơn retention_days ngày."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    ids = select(Notification.id).where(Notification.read == True, Notification.timestamp < cutoff)
+    return _delete_in_batches(db, ids, batch_size)
+
+def collapse_login_notifications(
+    db: Session,
+    keep: int = LOGIN_NOTIFICATIONS_KEEP,
+    batch_size: int = NOTIFICATION_RETENTION_BATCH_SIZE,
+) -> int:
+    """Chỉ giữ `keep` notification "Đăng nhập thành công" mới nhất của mỗi user.
+
+    Chỉ xóa những cái đã đọc: notification chưa đọc vẫn được giữ (và vẫn tính
+    vào `keep`) cho tới khi user đọc, rồi bị gom ở lần chạy sau.
+    """
+    ranked = (
+        select(
+            Notification.id,
+            Notification.read,
+            func.row_number().over(
+                partition_by=Notification.user_id,
+                order_by=(Notification.timestamp.desc(), Notification.id.desc()),
+            ).label("rn"),
+        )
+        .where(Notification.type == "system", Notification.title == LOGIN_NOTIFICATION_TITLE)
+        .subquery()
+    )
+    ids = (
+        select(ranked.c.id)
+        .where(ranked.c.rn > keep, ranked.c.read == True)
+        .order_by(ranked.c.id)
+    )
+    # Tính window function một lần rồi xóa theo id; chạy lại nó cho mỗi đợt
+    # sẽ quét toàn bộ notification đăng nhập mỗi lần (bậc hai theo kích thước bảng)
+    return _delete_ids(db, db.execute(ids).scalars().all(), batch_size)
+
+def run_notification_retention(db: Session):
+    collapsed = collapse_login_notifications(db)
+    purged = purge_read_notifications(db)
+    print(f"🧹 Notification retention: {collapsed} login notifications collapsed, {purged} old read notifications deleted")
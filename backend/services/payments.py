@@ -0,0 +1,161 @@
+import asyncio
+import os
+from typing import Dict, Optional, Set
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import Booking, PaymentOrder
+from services.broker import broker
+from services.cache import TTLCache
+
+# Chỉ cache trạng thái đã chốt (success/failed); "pending" luôn đọc lại từ DB
+PAYMENT_STATUS_CACHE_TTL_SECONDS = float(os.getenv("PAYMENT_STATUS_CACHE_TTL_SECONDS", 300))
+PAYMENT_STATUS_CACHE_MAX_ENTRIES = int(os.getenv("PAYMENT_STATUS_CACHE_MAX_ENTRIES", 10000))
+# Kết quả webhook được báo cho các worker khác qua broker
+PAYMENT_CHANNEL = "payment"
+# Long-poll (/wait) giữ kết nối tối đa chừng này giây rồi trả "pending"
+PAYMENT_WAIT_MAX_SECONDS = float(os.getenv("PAYMENT_WAIT_MAX_SECONDS", 60))
+# SSE (/stream): đóng stream sau chừng này giây (EventSource tự kết nối lại),
+# gửi comment keepalive mỗi PAYMENT_STREAM_KEEPALIVE_SECONDS để proxy không cắt kết nối
+PAYMENT_STREAM_TIMEOUT_SECONDS = float(os.getenv("PAYMENT_STREAM_TIMEOUT_SECONDS", 300))
+PAYMENT_STREAM_KEEPALIVE_SECONDS = float(os.getenv("PAYMENT_STREAM_KEEPALIVE_SECONDS", 15))
+
+FINAL_STATUSES = ("success", "failed")
+PAYMENT_MESSAGES = {
+    "pending": "Đang chờ thanh toán...",
+    "success": "Thanh toán thành công!",
+    "failed": "Thanh toán thất bại!",
+}
+
+_status_cache = TTLCache(PAYMENT_STATUS_CACHE_TTL_SECONDS, PAYMENT_STATUS_CACHE_MAX_ENTRIES)
+# Các request đang chờ kết quả của từng order_code (mỗi request một Event)
+_waiters: Dict[str, Set[asyncio.Event]] = {}
+
+
+def _remember(result: dict):
+    # delete() tăng generation: kết quả cũ đang được đọc song song sẽ không ghi đè lên
+    _status_cache.delete(result["order_code"])
+    _status_cache.set(result["order_code"], result)
+
+
+def pending_status(order_code: str) -> dict:
+    return {"status": "pending", "order_code": order_code, "message": PAYMENT_MESSAGES["pending"]}
+
+
+def serialize_payment_order(order: PaymentOrder) -> dict:
+    if order.status not in FINAL_STATUSES:
+        return pending_status(order.order_code)
+    return {
+        "status": order.status,
+        "order_code": order.order_code,
+        "amount": order.amount,
+        "message": order.message or PAYMENT_MESSAGES[order.status],
+    }
+
+
+async def create_payment_order(
+    db: AsyncSession,
+    order_code: str,
+    amount: int,
+    user_id: int,
+    booking_id: Optional[int] = None
+):
+    """Ghi đơn "pending" trước khi tạo link PayOS (gọi lại với cùng order_code thì bỏ qua)."""
+    stmt = insert(PaymentOrder).values(
+        order_code=order_code, status="pending", amount=amount, user_id=user_id, booking_id=booking_id
+    ).on_conflict_do_nothing(index_elements=[PaymentOrder.order_code])
+    await db.execute(stmt)
+    await db.commit()
+
+
+async def get_payment_status(order_code: str) -> dict:
+    cached = _status_cache.get(order_code)
+    if cached is not None:
+        return cached
+
+    generation = _status_cache.generation
+    async with AsyncSessionLocal() as db:
+        order = await db.get(PaymentOrder, order_code)
+    if order is None:
+        return pending_status(order_code)
+    result = serialize_payment_order(order)
+    if order.status in FINAL_STATUSES:
+        _status_cache.set(order_code, result, generation)
+    return result
+
+
+async def record_payment_result(order_code: str, success: bool, amount: Optional[int]) -> dict:
+    """Lưu kết quả webhook và cập nhật Booking.payment_status.
+
+    Idempotent: webhook gửi lặp lại không đổi gì; đơn đã "success" không bị ghi đè.
+    """
+    status = "success" if success else "failed"
+    values = {"status": status, "amount": amount, "message": PAYMENT_MESSAGES[status]}
+    stmt = (
+        insert(PaymentOrder)
+        .values(order_code=order_code, **values)
+        .on_conflict_do_update(
+            index_elements=[PaymentOrder.order_code],
+            set_={**values, "updated_at": func.now()},
+            where=PaymentOrder.status != "success",
+        )
+        .returning(PaymentOrder.booking_id)
+    )
+
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(stmt)).first()
+        if row is None:
+            # Đơn đã thành công trước đó: trả lại trạng thái đã lưu
+            await db.commit()
+            order = await db.get(PaymentOrder, order_code)
+            return serialize_payment_order(order)
+        if success and row.booking_id is not None:
+            await db.execute(
+                update(Booking)
+                .where(Booking.id == row.booking_id, Booking.payment_status != "paid")
+                .values(payment_status="paid")
+            )
+        await db.commit()
+
+    result = {"order_code": order_code, **values}
+    _remember(result)
+    _wake(order_code)
+    await broker.publish(PAYMENT_CHANNEL, result)
+    return result
+
+
+def _wake(order_code: str):
+    for event in _waiters.pop(order_code, ()):
+        event.set()
+
+
+async def wait_for_payment(order_code: str, timeout: float) -> dict:
+    """Trả trạng thái ngay khi đã chốt, hoặc chờ webhook tối đa `timeout` giây."""
+    event = asyncio.Event()
+    # Đăng ký trước khi đọc trạng thái để không lỡ webhook tới giữa hai bước
+    _waiters.setdefault(order_code, set()).add(event)
+    try:
+        result = await get_payment_status(order_code)
+        if result["status"] in FINAL_STATUSES:
+            return result
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return result
+        return await get_payment_status(order_code)
+    finally:
+        waiters = _waiters.get(order_code)
+        if waiters is not None:
+            waiters.discard(event)
+            if not waiters:
+                del _waiters[order_code]
+
+
+async def _on_payment_result(message: dict):
+    _remember(message)
+    _wake(message["order_code"])
+
+
+broker.subscribe(PAYMENT_CHANNEL, _on_payment_result)
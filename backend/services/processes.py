@@ -0,0 +1,12 @@
+import multiprocessing
+
+
+def process_context():
+    """Context cho ProcessPoolExecutor trong worker API.
+
+    Process uvicorn chạy nhiều thread (thread pool, asyncpg, ...); fork lúc một
+    thread khác đang giữ lock có thể làm process con bị treo, nên dùng forkserver
+    (hoặc spawn trên nền tảng không có forkserver).
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
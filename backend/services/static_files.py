@@ -0,0 +1,140 @@
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from services.storage import IMMUTABLE_CACHE_CONTROL
+
+# Đặt (vd. "/_uploads/") khi chạy sau nginx: Python chỉ trả header X-Accel-Redirect,
+# nginx tự gửi file bằng sendfile (xem README)
+UPLOADS_ACCEL_REDIRECT_PREFIX = os.getenv("UPLOADS_ACCEL_REDIRECT_PREFIX")
+# File cũ đặt tên bằng uuid: không đổi nội dung nhưng không kiểm chứng được
+UPLOADS_DEFAULT_CACHE_CONTROL = os.getenv("UPLOADS_DEFAULT_CACHE_CONTROL", "public, max-age=86400")
+
+# Tên file theo nội dung: <sha256>[_variant].<ext>
+CONTENT_HASHED_NAME = re.compile(r"^[0-9a-f]{64}(_[a-z]+)?(\.[A-Za-z0-9]+)?$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Đọc header Range một khoảng ("bytes=0-99", "bytes=100-", "bytes=-100").
+
+    Trả về (start, end) tính cả end; None nếu header không hợp lệ hoặc nhiều
+    khoảng (khi đó trả cả file như bình thường).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_s, sep, end_s = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start_s == "":
+            suffix = int(end_s)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+            if end_s and end < start:
+                return None
+            end = min(end, size - 1)
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """206 Partial Content: chỉ đọc và gửi đúng khoảng byte được yêu cầu."""
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: str, start: int, end: int, size: int, headers: dict, media_type: Optional[str]):
+        super().__init__(status_code=206, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # File bị cắt ngắn trong lúc gửi
+            await send({"type": "http.response.body", "body": b""})
+
+
+class UploadStaticFiles(StaticFiles):
+    """StaticFiles cho /uploads: cache header theo tên file, hỗ trợ Range, X-Accel-Redirect."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        # Không phục vụ file ẩn/file tạm đang upload (uploads/.tmp)
+        if any(part.startswith(".") for part in path.replace("\\", "/").split("/") if part):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200) -> Response:
+        name = os.path.basename(full_path)
+        cache_control = (
+            IMMUTABLE_CACHE_CONTROL if CONTENT_HASHED_NAME.match(name) else UPLOADS_DEFAULT_CACHE_CONTROL
+        )
+
+        if UPLOADS_ACCEL_REDIRECT_PREFIX and status_code == 200:
+            relative = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+            return Response(headers={
+                "X-Accel-Redirect": UPLOADS_ACCEL_REDIRECT_PREFIX + quote(relative),
+                "Cache-Control": cache_control,
+            })
+
+        # FileResponse của StaticFiles đã xử lý ETag/Last-Modified và 304
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = cache_control
+        if response.status_code != 200:
+            return response
+        response.headers["Accept-Ranges"] = "bytes"
+
+        request_headers = Headers(scope=scope)
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if not range_header or (if_range and if_range != response.headers.get("etag")):
+            return response
+
+        size = stat_result.st_size
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if byte_range is None:
+            return response
+
+        headers = {
+            key: response.headers[key]
+            for key in ("etag", "last-modified", "cache-control", "accept-ranges")
+            if key in response.headers
+        }
+        return RangeFileResponse(full_path, *byte_range, size, headers, response.media_type)
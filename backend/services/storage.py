@@ -0,0 +1,264 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, literal_column, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database import AsyncSessionLocal
+from models import StoredFile
+
+# "local": thư mục uploads/ (StaticFiles phục vụ tại /uploads)
+# "s3": bucket S3 hoặc dịch vụ tương thích (MinIO, ...), cần cài boto3
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+UPLOAD_DIR = "uploads"
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # vd. http://localhost:9000 cho MinIO
+S3_REGION = os.getenv("S3_REGION")
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL")      # mặc định <endpoint>/<bucket>
+# File không còn ai dùng được giữ thêm khoảng này trước khi xóa hẳn
+STORAGE_ORPHAN_GRACE_HOURS = float(os.getenv("STORAGE_ORPHAN_GRACE_HOURS", 24))
+
+# File lưu theo nội dung thì không bao giờ đổi, cho phép cache vĩnh viễn
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def content_key(sha256: str, ext: str) -> str:
+    return f"{sha256}{ext.lower()}"
+
+
+class StorageBackend(ABC):
+    """Nơi lưu file upload, truy cập theo key; DB lưu URL trả về từ url(key)."""
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        ...
+
+    @abstractmethod
+    def key_from_url(self, url: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def put_file(self, local_path: str, key: str):
+        """Lưu file tạm local_path dưới key (bỏ qua nếu key đã có) rồi xóa file tạm."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    def put_files(self, items: List[Tuple[str, str]]):
+        for local_path, key in items:
+            self.put_file(local_path, key)
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str = UPLOAD_DIR, url_prefix: str = "uploads/"):
+        self.root = root
+        self.url_prefix = url_prefix
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def url(self, key: str) -> str:
+        return self.url_prefix + key
+
+    def key_from_url(self, url: str) -> Optional[str]:
+        key = url.lstrip("/")
+        if not key.startswith(self.url_prefix):
+            return None
+        key = key[len(self.url_prefix):]
+        return key if key and "/" not in key else None
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def put_file(self, local_path: str, key: str):
+        if self.exists(key):
+            os.remove(local_path)
+        else:
+            os.replace(local_path, self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Storage(StorageBackend):
+    def __init__(
+        self,
+        bucket: Optional[str] = S3_BUCKET,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        region: Optional[str] = S3_REGION,
+        public_url: Optional[str] = S3_PUBLIC_URL,
+    ):
+        import boto3
+
+        if not bucket:
+            raise ValueError("Thiếu S3_BUCKET cho STORAGE_BACKEND=s3")
+        # Thông tin đăng nhập lấy từ AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.bucket = bucket
+        if not public_url:
+            public_url = f"{endpoint_url.rstrip('/')}/{bucket}" if endpoint_url else f"https://{bucket}.s3.amazonaws.com"
+        self.public_url = public_url.rstrip("/") + "/"
+
+    def url(self, key: str) -> str:
+        return self.public_url + key
+
+    def key_from_url(self, url: str) -> Optional[str]:
+        if not url.startswith(self.public_url):
+            return None
+        return url[len(self.public_url):] or None
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put_file(self, local_path: str, key: str):
+        import mimetypes
+
+        try:
+            if not self.exists(key):
+                extra = {"CacheControl": IMMUTABLE_CACHE_CONTROL}
+                content_type = mimetypes.guess_type(key)[0]
+                if content_type:
+                    extra["ContentType"] = content_type
+                self.client.upload_file(local_path, self.bucket, key, ExtraArgs=extra)
+        finally:
+            os.remove(local_path)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> StorageBackend:
+    if backend == "local":
+        return LocalStorage()
+    if backend == "s3":
+        return S3Storage()
+    raise ValueError(f"STORAGE_BACKEND không hợp lệ: {backend}")
+
+
+storage = create_storage()
+
+
+async def register_file(key: str, size: int) -> Optional[datetime]:
+    """Ghi nhận file vừa upload (ref_count giữ nguyên, chỉ làm mới updated_at).
+
+    Trả về updated_at nếu lần này tạo dòng mới (nội dung chưa từng có), None nếu
+    dòng đã tồn tại - khi đó file có thể đang thuộc về một upload khác.
+    """
+    stmt = insert(StoredFile).values(key=key, size=size, ref_count=0)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StoredFile.key], set_={"updated_at": func.now()}
+    ).returning(StoredFile.updated_at, literal_column("xmax = 0").label("created"))
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(stmt)).one()
+        await db.commit()
+    return row.updated_at if row.created else None
+
+
+def _delete_objects(keys: Iterable[str]):
+    from services.images import IMAGE_VARIANTS, variant_path
+
+    for key in keys:
+        for name in IMAGE_VARIANTS:
+            storage.delete(variant_path(key, name))
+        storage.delete(key)
+
+
+async def discard_uploads(uploads: Iterable[Tuple[str, datetime]]):
+    """Xóa ngay các file vừa upload cho một request bị lỗi, thay vì chờ job dọn dẹp.
+
+    `uploads` là các (key, updated_at) do register_file trả về. Chỉ xóa dòng vẫn
+    còn đúng updated_at đó và ref_count = 0, tức là chưa có upload nào khác cùng
+    nội dung chạm vào và chưa ai dùng; các file còn lại để purge_unreferenced_files xử lý.
+    """
+    uploads = list(uploads)
+    if not uploads:
+        return
+    async with AsyncSessionLocal() as db:
+        # Giữ khóa dòng tới khi xóa xong object, giống purge_unreferenced_files
+        keys = (await db.execute(
+            select(StoredFile.key)
+            .where(
+                tuple_(StoredFile.key, StoredFile.updated_at).in_(uploads),
+                StoredFile.ref_count <= 0,
+            )
+            .with_for_update(skip_locked=True)
+        )).scalars().all()
+        if keys:
+            await asyncio.to_thread(_delete_objects, keys)
+            await db.execute(delete(StoredFile).where(StoredFile.key.in_(keys)))
+        await db.commit()
+
+
+def _ref_deltas(urls: Iterable[Optional[str]]) -> Dict[int, List[str]]:
+    """Gom key theo số lần xuất hiện: {số lần: [key, ...]}."""
+    counts = Counter(
+        key for key in (storage.key_from_url(url) for url in urls if url) if key
+    )
+    grouped: Dict[int, List[str]] = {}
+    for key, n in counts.items():
+        grouped.setdefault(n, []).append(key)
+    return grouped
+
+
+async def acquire_files(db: AsyncSession, urls: Iterable[Optional[str]]):
+    """Tăng ref_count cho các file được tham chiếu; gọi trước commit, cùng transaction."""
+    for n, keys in _ref_deltas(urls).items():
+        await db.execute(
+            update(StoredFile).where(StoredFile.key.in_(keys)).values(ref_count=StoredFile.ref_count + n)
+        )
+
+
+async def release_files(db: AsyncSession, urls: Iterable[Optional[str]]):
+    """Giảm ref_count; file về 0 sẽ được purge_unreferenced_files xóa sau thời gian chờ."""
+    for n, keys in _ref_deltas(urls).items():
+        await db.execute(
+            update(StoredFile)
+            .where(StoredFile.key.in_(keys))
+            .values(ref_count=func.greatest(StoredFile.ref_count - n, 0), updated_at=func.now())
+        )
+
+
+def purge_unreferenced_files(db: Session, batch_size: int = 100):
+    """Job: xóa file không còn được tham chiếu (kể cả upload của request bị lỗi)."""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=STORAGE_ORPHAN_GRACE_HOURS)
+    purged = 0
+    while True:
+        # Giữ khóa dòng tới khi xóa xong object: upload lại cùng nội dung (register_file)
+        # phải chờ, rồi tạo dòng mới và ghi lại object thay vì thấy object sắp bị xóa
+        keys = db.execute(
+            select(StoredFile.key)
+            .where(StoredFile.ref_count <= 0, StoredFile.updated_at < cutoff)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not keys:
+            break
+
+        _delete_objects(keys)
+        db.execute(delete(StoredFile).where(StoredFile.key.in_(keys)))
+        db.commit()
+        purged += len(keys)
+
+    if purged:
+        print(f"✅ Đã xóa {purged} file upload không còn được dùng")
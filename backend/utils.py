@@ -1,18 +1,180 @@
+import asyncio
+import base64
+import hashlib
+import json
 import os
+import threading
+from datetime import datetime
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
 from uuid import uuid4
-from fastapi import UploadFile
-
-async def save_file(file: UploadFile) -> str:
-    UPLOAD_DIR = "uploads"
-    
-    # Tạo tên file unique để tránh trùng
-    ext = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid4().hex}{ext}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
-    # Lưu file
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
-
-    return file_path
\ No newline at end of file
+from fastapi import HTTPException, UploadFile
+from services.images import IMAGE_VARIANTS, generate_variants, has_all_variants, variant_path
+from services.storage import UPLOAD_DIR, content_key, discard_uploads, register_file, storage
+
+# Copy file upload theo từng chunk trong thread pool, không đọc cả file vào RAM
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_MB", 10)) * 1024 * 1024
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_MB", 100)) * 1024 * 1024
+# Số file được ghi đồng thời trên mỗi worker
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 4))
+# File tạm trong lúc nhận upload (cùng ổ đĩa với uploads/ để os.replace không phải copy)
+UPLOAD_TMP_DIR = os.path.join(UPLOAD_DIR, ".tmp")
+
+_upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+
+class SavedUpload(NamedTuple):
+    path: str                   # URL lưu vào DB
+    size: int
+    sha256: str
+    variants: Dict[str, str]    # tên bản WebP -> URL (chỉ khi lưu kèm variants)
+    # updated_at của dòng stored_files nếu upload này tạo mới nó (xem register_file)
+    registered_at: Optional[datetime] = None
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadBudget:
+    """Tổng dung lượng còn được phép ghi trong một request (dùng chung giữa các file)."""
+
+    def __init__(self, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.max_bytes = max_bytes
+        self.remaining = max_bytes
+        self._lock = threading.Lock()
+
+    def take(self, n: int):
+        with self._lock:
+            if n > self.remaining:
+                raise UploadTooLarge(f"Tổng dung lượng file vượt quá {_mb(self.max_bytes)}")
+            self.remaining -= n
+
+
+def _mb(n: int) -> str:
+    return f"{n / (1024 * 1024):g} MB"
+
+
+def _copy_to_disk(src: BinaryIO, dest_path: str, max_bytes: int, budget: UploadBudget) -> Tuple[int, str]:
+    """Chạy trong thread: copy từng chunk, vừa đếm dung lượng vừa tính sha256."""
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest_path, "wb") as out:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File vượt quá {_mb(max_bytes)}")
+                budget.take(len(chunk))
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        # Không để lại file ghi dở
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return size, digest.hexdigest()
+
+
+def _is_stored(key: str, variants: bool) -> bool:
+    return storage.exists(key) and (not variants or has_all_variants(key))
+
+
+async def save_upload(
+    file: UploadFile,
+    budget: Optional[UploadBudget] = None,
+    max_bytes: int = UPLOAD_MAX_FILE_BYTES,
+    variants: bool = False,
+) -> SavedUpload:
+    """Lưu file vào storage theo nội dung (sha256): upload trùng nội dung dùng chung một file.
+
+    File được ghi nhận trong bảng stored_files với ref_count = 0; nơi dùng file
+    phải gọi services.storage.acquire_files, nếu không job dọn dẹp sẽ xóa nó.
+    """
+    budget = budget or UploadBudget()
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"{file.filename}: File vượt quá {_mb(max_bytes)}")
+
+    ext = os.path.splitext(file.filename or "")[1]
+    tmp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid4().hex}{ext}")
+
+    async with _upload_slots:
+        try:
+            await file.seek(0)
+            size, sha256 = await asyncio.to_thread(_copy_to_disk, file.file, tmp_path, max_bytes, budget)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=f"{file.filename}: {e}")
+
+        key = content_key(sha256, ext)
+        rendered = {}
+        registered_at = None
+        try:
+            # register_file trước khi kiểm tra storage: nó chờ purge_unreferenced_files
+            # đang xóa cùng key và làm mới updated_at để job không xóa file ngay sau đó
+            registered_at = await register_file(key, size)
+            already_stored = registered_at is None and await asyncio.to_thread(
+                _is_stored, key, variants
+            )
+            # Upload lại nội dung đã có đủ file gốc (và bản WebP): không render, không ghi lại
+            if not already_stored:
+                rendered = await generate_variants(tmp_path) if variants else {}
+                # Lưu các bản WebP trước file gốc: có file gốc thì chắc chắn đã có variants
+                items = [(path, variant_path(key, name)) for name, path in rendered.items()]
+                items.append((tmp_path, key))
+                await asyncio.to_thread(storage.put_files, items)
+        except Exception:
+            if registered_at is not None:
+                await discard_uploads([(key, registered_at)])
+            raise
+        finally:
+            for path in [tmp_path, *rendered.values()]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    variant_names = IMAGE_VARIANTS if already_stored and variants else rendered
+    return SavedUpload(
+        storage.url(key), size, sha256,
+        {name: storage.url(variant_path(key, name)) for name in variant_names},
+        registered_at,
+    )
+
+
+async def save_files(
+    files: List[UploadFile], budget: Optional[UploadBudget] = None, variants: bool = False
+) -> List[SavedUpload]:
+    """Lưu nhiều file đồng thời, dùng chung giới hạn dung lượng của request."""
+    budget = budget or UploadBudget()
+    results = await asyncio.gather(
+        *(save_upload(f, budget, variants=variants) for f in files), return_exceptions=True
+    )
+    # Chờ mọi file xong rồi mới báo lỗi. Request lỗi thì không ai dùng các file đã lưu:
+    # xóa ngay file do chính request này tạo; file trùng nội dung với upload khác
+    # (registered_at = None) để job dọn dẹp xử lý sau thời gian chờ
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if failed:
+        await discard_uploads(
+            (key, r.registered_at)
+            for r in results
+            if isinstance(r, SavedUpload) and r.registered_at is not None
+            and (key := storage.key_from_url(r.path)) is not None
+        )
+        raise failed[0]
+    return results
+
+
+# Cursor cho keyset pagination: danh sách giá trị của bản ghi cuối trang, mã hóa base64
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    return values
@@ -259,6 +259,23 @@ const handleWebSocketMessage = (data) => {
     return;
   }
 
+  if (data.error) {
+    console.warn("WebSocket error message:", data);
+    return;
+  }
+
+  // Server đã lưu tin nhắn: thay id tạm bằng id thật
+  if (data.type === "message_saved") {
+    const otherUserId = data.from === user.id ? data.to : data.from;
+    setMessages((prev) => ({
+      ...prev,
+      [otherUserId]: (prev[otherUserId] || []).map((m) =>
+        m.id === data.temp_id ? { ...m, id: data.id, created_at: data.created_at } : m
+      ),
+    }));
+    return;
+  }
+
   const { id, from, to, message: content, created_at, temp_id } = data;
   let targetUserId, newMessage;
 
@@ -118,32 +118,54 @@ const PaymentPage = () => {
      * =======================
      */
 useEffect(() => {
-    let interval;
-    if (orderCode && paymentStatus === 'ready') {
-        interval = setInterval(async () => {
+    if (!orderCode || paymentStatus !== 'ready') return;
+    let stopped = false;
+    let source;
+
+    // Trả về true khi đã có kết quả cuối cùng
+    const handleStatus = (data) => {
+        if (data.status === 'success') {
+            setPaymentStatus('success');
+            setCurrentStep(2);
+            message.success('Thanh toán thành công!');
+            setTimeout(() => navigate('/my-bookings'), 3000);
+            return true;
+        }
+        if (data.status === 'failed') {
+            setPaymentStatus('failed');
+            message.error('Thanh toán thất bại. Vui lòng thử lại.');
+            return true;
+        }
+        return false;
+    };
+
+    // Long-poll: server giữ request tới khi có kết quả hoặc hết thời gian chờ
+    const longPoll = async () => {
+        while (!stopped) {
             try {
-                const token = localStorage.getItem('token');
-                const res = await fetch(`${process.env.REACT_APP_API_URL}/api/payment/check-status/${orderCode}`, {
-                    headers: { 'Authorization': `Bearer ${token}` }
-                });
+                const res = await fetch(`${process.env.REACT_APP_API_URL}/api/payment/wait/${orderCode}`);
                 const data = await res.json();
-                if (data.status === 'success') {
-                    setPaymentStatus('success');
-                    setCurrentStep(2);
-                    message.success('Thanh toán thành công!');
-                    clearInterval(interval);
-                    setTimeout(() => navigate('/my-bookings'), 3000);
-                } else if (data.status === 'failed') {
-                    setPaymentStatus('failed');
-                    clearInterval(interval);
-                    message.error('Thanh toán thất bại. Vui lòng thử lại.');
-                }
+                if (!stopped && handleStatus(data)) return;
             } catch (err) {
-                console.error('Polling error:', err);
+                console.error('Long-poll error:', err);
+                await new Promise((resolve) => setTimeout(resolve, 3000));
             }
-        }, 3000); // 3 giây kiểm tra 1 lần
+        }
+    };
+
+    if (window.EventSource) {
+        // Server đẩy kết quả ngay khi nhận webhook; EventSource tự kết nối lại khi stream đóng
+        source = new EventSource(`${process.env.REACT_APP_API_URL}/api/payment/stream/${orderCode}`);
+        source.onmessage = (event) => {
+            if (handleStatus(JSON.parse(event.data))) source.close();
+        };
+    } else {
+        longPoll();
     }
-    return () => clearInterval(interval);
+    return () => {
+        stopped = true;
+        if (source) source.close();
+    };
 }, [orderCode, paymentStatus, navigate]);
 
     /** =======================
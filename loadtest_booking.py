@@ -0,0 +1,126 @@
+"""Load test đặt sân (POST /api/bookings/).
+
+1. Tranh chấp: --attempts request đồng thời cùng đặt một court/khung giờ.
+   Kiểm tra đúng 1 request thành công, còn lại nhận 409.
+2. Không tranh chấp: --uncontended request, mỗi request một khung giờ khác nhau,
+   đo số booking/giây và độ trễ.
+
+Chạy với DB dev (script tạo user thử và booking ở một ngày ngẫu nhiên trong tương lai):
+    python loadtest_booking.py --attempts 500 --uncontended 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+
+from loadtest_common import make_token, percentiles, seed_users
+
+
+def pick_facility(facility_id=None):
+    from database import SessionLocal
+    from models import Facility
+
+    db = SessionLocal()
+    try:
+        query = db.query(Facility.id, Facility.sport_type).filter(Facility.is_active == True)
+        if facility_id is not None:
+            query = query.filter(Facility.id == facility_id)
+        facility = query.order_by(Facility.id).first()
+        if facility is None:
+            sys.exit("Không có sân nào để test (chạy seed.py trước)")
+        return facility.id, (facility.sport_type or ["Bóng đá"])[0]
+    finally:
+        db.close()
+
+
+def booking_body(facility_id: int, sport_type: str, court_id: int, start: datetime) -> dict:
+    end = start + timedelta(hours=1)
+    return {
+        "facility_id": facility_id,
+        "sport_type": sport_type,
+        "court_id": court_id,
+        "booking_date": start.replace(hour=0).isoformat(),
+        "start_time": start.isoformat(),
+        "end_time": end.isoformat(),
+        "time_slots": [f"{start:%H:%M}-{end:%H:%M}"],
+        "total_price": 100000,
+    }
+
+
+async def post_booking(client: httpx.AsyncClient, token: str, body: dict, latencies: list) -> int:
+    started = time.perf_counter()
+    response = await client.post("/api/bookings/", json=body, headers={"Authorization": f"Bearer {token}"})
+    latencies.append(time.perf_counter() - started)
+    return response.status_code
+
+
+async def contended(client, tokens, facility_id, sport_type, day: datetime, attempts: int) -> bool:
+    body = booking_body(facility_id, sport_type, 0, day.replace(hour=18))
+    latencies = []
+    codes = await asyncio.gather(*(
+        post_booking(client, tokens[i % len(tokens)], body, latencies) for i in range(attempts)
+    ))
+    counts = Counter(codes)
+    won = sum(n for code, n in counts.items() if 200 <= code < 300)
+    print(f"[tranh chấp] {attempts} request cùng khung giờ: {dict(counts)}")
+    print(f"[tranh chấp] độ trễ: {percentiles(latencies)}")
+    ok = won == 1 and counts[409] == attempts - 1
+    print("[tranh chấp] OK: đúng 1 booking thành công" if ok else "[tranh chấp] LỖI: kết quả không đúng")
+    return ok
+
+
+async def uncontended(client, tokens, facility_id, sport_type, day: datetime, total: int, concurrency: int):
+    # Mỗi request một (ngày, court, giờ) riêng: 16 khung giờ x 4 court mỗi ngày
+    slots = [
+        (day + timedelta(days=i // 64)).replace(hour=6 + i % 16)
+        for i in range(total)
+    ]
+    courts = [(i // 16) % 4 for i in range(total)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            body = booking_body(facility_id, sport_type, courts[i], slots[i])
+            return await post_booking(client, tokens[i % len(tokens)], body, latencies)
+
+    started = time.perf_counter()
+    codes = await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    counts = Counter(codes)
+    print(f"[không tranh chấp] {total} request, concurrency {concurrency}: {dict(counts)}")
+    print(f"[không tranh chấp] {total / elapsed:.0f} booking/giây, độ trễ: {percentiles(latencies)}")
+
+
+async def main(args):
+    users = seed_users(args.users, prefix="booking_loadtest")
+    tokens = [make_token(user_id, role) for user_id, role in users]
+    facility_id, sport_type = pick_facility(args.facility_id)
+    # Ngày ngẫu nhiên trong tương lai để các lần chạy không đụng booking cũ
+    day = datetime.combine(datetime.now().date(), datetime.min.time()) + timedelta(days=random.randint(365, 3650))
+    print(f"Sân {facility_id} ({sport_type}), bắt đầu từ ngày {day:%Y-%m-%d}")
+
+    limits = httpx.Limits(max_connections=max(args.attempts, args.concurrency))
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        ok = await contended(client, tokens, facility_id, sport_type, day, args.attempts)
+        await uncontended(
+            client, tokens, facility_id, sport_type, day + timedelta(days=1), args.uncontended, args.concurrency
+        )
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--facility-id", type=int)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--attempts", type=int, default=500)
+    parser.add_argument("--uncontended", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
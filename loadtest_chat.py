@@ -0,0 +1,105 @@
+"""Load test websocket chat (/api/messages/chat).
+
+Mở N kết nối (mặc định 5000), mỗi client gửi tin nhắn cho client kế tiếp
+với tốc độ --rate tin/giây trong --duration giây, rồi đo:
+  - số tin/giây được giao cho người nhận
+  - độ trễ giao tin (gửi -> người nhận thấy tin với id tạm)
+  - độ trễ lưu DB (gửi -> người gửi nhận id thật)
+
+Chạy (cần backend đang chạy và truy cập được DB để tạo user thử):
+    ulimit -n 20000
+    python loadtest_chat.py --clients 5000 --rate 1 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import websockets
+
+from loadtest_common import make_token, percentiles, seed_users
+
+sent_at = {}
+delivery_latencies = []
+save_latencies = []
+errors = []
+
+
+async def run_client(url: str, user_id: int, token: str, receiver_id: int, rate: float,
+                     start: asyncio.Event, stop_at: list, connected: list):
+    try:
+        ws = await websockets.connect(f"{url}?token={token}", max_queue=None, open_timeout=60)
+    except Exception as e:
+        errors.append(f"connect {user_id}: {e}")
+        return
+    connected.append(user_id)
+
+    async def reader():
+        async for raw in ws:
+            data = json.loads(raw)
+            temp_id = data.get("temp_id")
+            if "error" in data:
+                errors.append(data["error"])
+            elif temp_id in sent_at:
+                elapsed = time.perf_counter() - sent_at[temp_id]
+                if data.get("to") == user_id and "message" in data:
+                    delivery_latencies.append(elapsed)
+                elif data.get("from") == user_id and "message" in data:
+                    save_latencies.append(elapsed)
+
+    reading = asyncio.create_task(reader())
+    await start.wait()
+    seq = 0
+    try:
+        while time.perf_counter() < stop_at[0]:
+            temp_id = f"lt-{user_id}-{seq}"
+            seq += 1
+            sent_at[temp_id] = time.perf_counter()
+            await ws.send(json.dumps({"receiver_id": receiver_id, "content": "load test", "temp_id": temp_id}))
+            await asyncio.sleep(1 / rate)
+        # Chờ các tin cuối được giao/lưu
+        await asyncio.sleep(2)
+    finally:
+        reading.cancel()
+        await ws.close()
+
+
+async def main(args):
+    users = seed_users(args.clients, prefix="chat_loadtest")
+    tokens = [make_token(user_id, role) for user_id, role in users]
+    start = asyncio.Event()
+    stop_at = [0.0]
+    connected = []
+
+    tasks = [
+        asyncio.create_task(run_client(
+            args.url, user_id, tokens[i], users[(i + 1) % len(users)][0], args.rate, start, stop_at, connected
+        ))
+        for i, (user_id, _) in enumerate(users)
+    ]
+    # Đợi mọi client kết nối xong rồi mới bắt đầu đo
+    while len(connected) + len(errors) < len(users):
+        await asyncio.sleep(0.5)
+    print(f"Đã kết nối {len(connected)}/{len(users)} client")
+
+    began = time.perf_counter()
+    stop_at[0] = began + args.duration
+    start.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - began
+
+    print(f"Đã gửi:   {len(sent_at)} tin")
+    print(f"Đã giao:  {len(delivery_latencies)} tin ({len(delivery_latencies) / elapsed:.0f} tin/giây)")
+    print(f"Trễ giao: {percentiles(delivery_latencies)}")
+    print(f"Trễ lưu:  {percentiles(save_latencies)} ({len(save_latencies)} tin có id thật)")
+    if errors:
+        print(f"Lỗi: {len(errors)} (vd. {errors[0]})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="ws://localhost:8000/api/messages/chat")
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=1.0, help="số tin mỗi client gửi mỗi giây")
+    parser.add_argument("--duration", type=float, default=30.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,56 @@
+"""Hàm dùng chung cho các script load test / benchmark ở thư mục gốc.
+
+Các script chạy trên máy có quyền truy cập DB (đọc backend/.env) để tạo
+user thử nghiệm và ký token trực tiếp, không phải gọi /login hàng nghìn lần.
+"""
+import os
+import statistics
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+
+def seed_users(count: int, prefix: str = "loadtest", password: str = None):
+    """Tạo (nếu chưa có) `count` user <prefix>_<i>, trả về [(id, role), ...]."""
+    from sqlalchemy import select
+    from sqlalchemy.dialects.postgresql import insert
+    from database import SessionLocal
+    from models import User
+
+    usernames = [f"{prefix}_{i}" for i in range(count)]
+    hashed_password = None
+    if password is not None:
+        from services.passwords import hash_password
+
+        hashed_password = hash_password(password)
+    db = SessionLocal()
+    try:
+        rows = [
+            {"username": name, "email": f"{name}@loadtest.local", "full_name": name, "role": "user", "is_active": True,
+             "hashed_password": hashed_password}
+            for name in usernames
+        ]
+        for i in range(0, len(rows), 1000):
+            db.execute(insert(User).values(rows[i:i + 1000]).on_conflict_do_nothing())
+        db.commit()
+        users = db.execute(
+            select(User.id, User.role).where(User.username.in_(usernames)).order_by(User.id)
+        ).all()
+        return [(u.id, u.role) for u in users]
+    finally:
+        db.close()
+
+
+def make_token(user_id: int, role: str = "user") -> str:
+    from auth import create_access_token
+
+    return create_access_token(data={"sub": f"loadtest_{user_id}", "role": role, "id": user_id})
+
+
+def percentiles(values, points=(50, 95, 99)) -> str:
+    if not values:
+        return "n/a"
+    ordered = sorted(values)
+    parts = [f"p{p}={ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000:.1f}ms" for p in points]
+    return f"mean={statistics.mean(ordered) * 1000:.1f}ms " + " ".join(parts)
@@ -0,0 +1,171 @@
+"""Benchmark dashboard của host (GET /api/facilities/host).
+
+Tạo (nếu chưa có) các host thử nghiệm sở hữu 1, 10 và 100 sân, mỗi sân có
+--bookings booking trong tháng này (một phần rơi vào hôm nay), rồi so sánh:
+  - trước: cách cũ, 1 query lấy sân + 4 query COUNT/SUM cho mỗi sân
+  - sau:   routes.facilities.get_facilities_for_host (một query GROUP BY + FILTER)
+In số query SQL mỗi lần tải dashboard, độ trễ, và kiểm tra hai cách ra cùng số liệu.
+
+Chạy (truy cập được DB):
+    python loadtest_host_dashboard.py --runs 50
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from loadtest_common import percentiles, seed_users
+
+PREFIX = "dashboard_loadtest"
+SIZES = (1, 10, 100)
+STAT_FIELDS = ("bookings_today", "revenue_today", "bookings_this_month", "revenue_this_month")
+
+
+def legacy_host_dashboard(db, owner_id: int):
+    """Cách cũ (trước khi gộp query), giữ lại chỉ để so sánh."""
+    from sqlalchemy import extract, func
+    from models import Booking, Facility
+
+    today = datetime.today().date()
+    now = datetime.today()
+    result = []
+    for f in db.query(Facility).filter(Facility.owner_id == owner_id).all():
+        bookings_today = (
+            db.query(func.count(Booking.id))
+            .filter(Booking.facility_id == f.id)
+            .filter(func.date(Booking.start_time) == today)
+            .scalar()
+        )
+        revenue_today = (
+            db.query(func.coalesce(func.sum(Booking.total_price), 0))
+            .filter(Booking.facility_id == f.id)
+            .filter(func.date(Booking.start_time) == today)
+            .scalar()
+        )
+        bookings_this_month = (
+            db.query(func.count(Booking.id))
+            .filter(Booking.facility_id == f.id)
+            .filter(extract("month", Booking.start_time) == now.month)
+            .filter(extract("year", Booking.start_time) == now.year)
+            .scalar()
+        )
+        revenue_this_month = (
+            db.query(func.coalesce(func.sum(Booking.total_price), 0))
+            .filter(Booking.facility_id == f.id)
+            .filter(extract("month", Booking.start_time) == now.month)
+            .filter(extract("year", Booking.start_time) == now.year)
+            .scalar()
+        )
+        result.append({
+            "id": f.id,
+            "bookings_today": bookings_today,
+            "revenue_today": revenue_today,
+            "bookings_this_month": bookings_this_month,
+            "revenue_this_month": revenue_this_month,
+        })
+    return result
+
+
+def seed_hosts(bookings_per_facility: int):
+    """Trả về {số sân: owner_id}; sân và booking chỉ được tạo ở lần chạy đầu."""
+    from sqlalchemy import func, insert
+    from database import SessionLocal
+    from models import Booking, Facility
+
+    hosts = seed_users(len(SIZES), prefix=PREFIX)
+    owners = {size: user_id for size, (user_id, _) in zip(SIZES, hosts)}
+    today_start = datetime.combine(datetime.today().date(), datetime.min.time())
+    month_start = today_start.replace(day=1)
+
+    db = SessionLocal()
+    try:
+        for size, owner_id in owners.items():
+            existing = db.query(func.count(Facility.id)).filter(Facility.owner_id == owner_id).scalar()
+            if existing >= size:
+                continue
+            facility_ids = db.execute(
+                insert(Facility).returning(Facility.id),
+                [
+                    {"name": f"{PREFIX}_{size}_{i}", "owner_id": owner_id, "sport_type": ["badminton"],
+                     "price_per_hour": 100000, "is_active": True}
+                    for i in range(existing, size)
+                ],
+            ).scalars().all()
+            bookings = []
+            for facility_id in facility_ids:
+                for i in range(bookings_per_facility):
+                    # Mỗi booking một court riêng nên không vướng constraint chống trùng giờ;
+                    # 1/4 số booking rơi vào hôm nay, còn lại rải trong tháng (kể cả tương lai)
+                    day = today_start if i % 4 == 0 else month_start + timedelta(days=i % 28)
+                    start = day.replace(hour=8 + i % 12)
+                    bookings.append({
+                        "user_id": owner_id, "facility_id": facility_id, "sport_type": "badminton",
+                        "court_id": i, "booking_date": day, "start_time": start,
+                        "end_time": start + timedelta(hours=1), "total_price": 100000 + i,
+                        "status": "confirmed", "payment_status": "paid", "payment_method": "cash",
+                    })
+            for i in range(0, len(bookings), 5000):
+                db.execute(insert(Booking).values(bookings[i:i + 5000]))
+            db.commit()
+        return owners
+    finally:
+        db.close()
+
+
+def measure(db, engine, load, owner_id: int, runs: int):
+    from sqlalchemy import event
+
+    queries = []
+
+    def count(*_):
+        queries[-1] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    latencies = []
+    try:
+        for _ in range(runs):
+            queries.append(0)
+            started = time.perf_counter()
+            result = load(db, owner_id)
+            latencies.append(time.perf_counter() - started)
+            # Bỏ identity map để lần sau tải lại sân như một request mới
+            db.rollback()
+            db.expunge_all()
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return result, max(queries), latencies
+
+
+def main(args):
+    from database import SessionLocal, engine
+    from routes.facilities import get_facilities_for_host
+
+    owners = seed_hosts(args.bookings)
+
+    def current(db, owner_id):
+        return get_facilities_for_host(db=db, owner_id=owner_id)
+
+    db = SessionLocal()
+    ok = True
+    try:
+        for size, owner_id in owners.items():
+            before, before_queries, before_latencies = measure(db, engine, legacy_host_dashboard, owner_id, args.runs)
+            after, after_queries, after_latencies = measure(db, engine, current, owner_id, args.runs)
+            print(f"[{size} sân] trước: {before_queries} query, {percentiles(before_latencies)}")
+            print(f"[{size} sân] sau:   {after_queries} query, {percentiles(after_latencies)}")
+
+            expected = {r["id"]: tuple(float(r[k]) for k in STAT_FIELDS) for r in before}
+            actual = {r["id"]: tuple(float(r[k]) for k in STAT_FIELDS) for r in after}
+            if expected != actual:
+                ok = False
+                print(f"[{size} sân] LỖI: số liệu hai cách khác nhau")
+    finally:
+        db.close()
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=50, help="số lần tải dashboard cho mỗi host")
+    parser.add_argument("--bookings", type=int, default=40, help="số booking mỗi sân trong tháng này")
+    main(parser.parse_args())
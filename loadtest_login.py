@@ -0,0 +1,115 @@
+"""Benchmark băm mật khẩu và đăng nhập.
+
+1. Cục bộ: số lần verify bcrypt/giây qua process pool (services.passwords),
+   quy ra mỗi core, với BCRYPT_ROUNDS / PASSWORD_HASH_WORKERS hiện tại.
+2. HTTP: đo độ trễ một endpoint không liên quan (mặc định GET /api/facilities/)
+   khi rảnh và trong lúc --concurrency client đăng nhập liên tục, kèm số
+   login/giây và số lần bị 503 (pool đầy).
+
+Chạy (backend đang chạy, truy cập được DB):
+    python loadtest_login.py --local-only
+    python loadtest_login.py --concurrency 200 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+
+import httpx
+
+from loadtest_common import percentiles, seed_users
+
+PASSWORD = "loadtest123"
+
+
+async def bench_local(seconds: float):
+    from services import passwords
+
+    hashed = passwords.hash_password(PASSWORD)
+    workers = passwords.PASSWORD_HASH_WORKERS
+    done = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            ok, _ = await passwords.verify_password_async(PASSWORD, hashed)
+            assert ok
+            done += 1
+
+    started = time.perf_counter()
+    # Giữ pool luôn đầy việc nhưng không vượt PASSWORD_HASH_MAX_PENDING
+    await asyncio.gather(*(worker() for _ in range(min(workers * 2, passwords.PASSWORD_HASH_MAX_PENDING))))
+    elapsed = time.perf_counter() - started
+    passwords.shutdown_password_pool()
+    rate = done / elapsed
+    print(f"[cục bộ] bcrypt rounds={passwords.BCRYPT_ROUNDS}, {workers} process: "
+          f"{rate:.1f} verify/giây ({rate / workers:.1f}/giây mỗi core, {os.cpu_count()} core máy)")
+
+
+async def probe(client: httpx.AsyncClient, path: str, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(path)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.05)
+
+
+async def bench_http(args):
+    users = seed_users(args.users, prefix="login_loadtest", password=PASSWORD)
+    usernames = [f"login_loadtest_{i}" for i in range(len(users))]
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60,
+                                 limits=httpx.Limits(max_connections=args.concurrency + 10)) as client:
+        # Độ trễ endpoint không liên quan khi không có đăng nhập
+        baseline = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, args.probe, stop, baseline))
+        await asyncio.sleep(5)
+        stop.set()
+        await task
+
+        during = []
+        codes = Counter()
+        stop = asyncio.Event()
+        probing = asyncio.create_task(probe(client, args.probe, stop, during))
+        deadline = time.perf_counter() + args.duration
+
+        async def login_loop(i):
+            while time.perf_counter() < deadline:
+                response = await client.post("/api/auth/login", json={
+                    "username": usernames[i % len(usernames)], "password": PASSWORD
+                })
+                codes[response.status_code] += 1
+                if response.status_code == 503:
+                    await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(login_loop(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probing
+
+    print(f"[http] {args.concurrency} client đăng nhập trong {elapsed:.0f}s: {dict(codes)}")
+    print(f"[http] {codes[200] / elapsed:.1f} login thành công/giây")
+    print(f"[http] {args.probe} khi rảnh:        {percentiles(baseline)}")
+    print(f"[http] {args.probe} khi đang login:  {percentiles(during)}")
+
+
+async def main(args):
+    await bench_local(args.local_seconds)
+    if not args.local_only:
+        await bench_http(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--probe", default="/api/facilities/", help="endpoint không liên quan để đo độ trễ")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--local-seconds", type=float, default=10.0)
+    parser.add_argument("--local-only", action="store_true")
+    asyncio.run(main(parser.parse_args()))
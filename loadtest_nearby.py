@@ -0,0 +1,141 @@
+"""Benchmark tìm sân gần (GET /api/facilities/nearby).
+
+Tạo (nếu chưa có) --facilities sân thử nghiệm rải ngẫu nhiên quanh --lat/--lng
+trong bán kính --spread km, rồi gọi endpoint với các điểm ngẫu nhiên trong vùng đó:
+  - chỉ lọc khoảng cách
+  - lọc khoảng cách + môn
+  - lọc khoảng cách + môn + giờ trống (date/start)
+Mỗi trường hợp in độ trễ khi gọi thẳng hàm route (không qua HTTP) và qua HTTP.
+Mục tiêu: p95 < 20 ms với 50k sân.
+
+Chạy (truy cập được DB; HTTP cần backend đang chạy):
+    python loadtest_nearby.py --facilities 50000 --requests 500
+    python loadtest_nearby.py --skip-http
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+from datetime import date, timedelta
+
+import httpx
+
+from loadtest_common import percentiles
+
+PREFIX = "nearby_loadtest"
+SPORTS = ["badminton", "football", "tennis", "pickleball", "basketball"]
+
+
+def seed_facilities(count: int, lat: float, lng: float, spread_km: float):
+    from sqlalchemy import func, insert, text
+    from database import SessionLocal
+    from models import Facility
+
+    db = SessionLocal()
+    try:
+        existing = db.query(func.count(Facility.id)).filter(Facility.name.like(f"{PREFIX}_%")).scalar()
+        rng = random.Random(42)
+        rows = []
+        for i in range(existing, count):
+            # Rải đều theo diện tích trong hình tròn bán kính spread_km
+            r = spread_km * math.sqrt(rng.random())
+            angle = rng.uniform(0, 2 * math.pi)
+            sports = rng.sample(SPORTS, rng.randint(1, 2))
+            rows.append({
+                "name": f"{PREFIX}_{i}",
+                "sport_type": sports,
+                "court_layout": [{"sport_type": s, "court_counts": rng.randint(1, 6)} for s in sports],
+                "price_per_hour": 100000,
+                "latitude": lat + r * math.sin(angle) / 111.32,
+                "longitude": lng + r * math.cos(angle) / (111.32 * math.cos(math.radians(lat))),
+                "opening_hours": "06:00 - 22:00",
+                "is_active": True,
+            })
+        for i in range(0, len(rows), 5000):
+            db.execute(insert(Facility).values(rows[i:i + 5000]))
+        db.commit()
+        if rows:
+            # Cập nhật thống kê để planner chọn index ix_facilities_earth
+            db.execute(text("ANALYZE facilities"))
+            db.commit()
+        print(f"Sân thử nghiệm: {existing} có sẵn, thêm {len(rows)}")
+    finally:
+        db.close()
+
+
+def random_point(rng: random.Random, lat: float, lng: float, spread_km: float):
+    r = spread_km * math.sqrt(rng.random())
+    angle = rng.uniform(0, 2 * math.pi)
+    return (
+        lat + r * math.sin(angle) / 111.32,
+        lng + r * math.cos(angle) / (111.32 * math.cos(math.radians(lat))),
+    )
+
+
+def cases(args):
+    day = date.today() + timedelta(days=1)
+    return {
+        "khoảng cách": {"radius": args.radius},
+        "+ môn": {"radius": args.radius, "sport_type": "badminton"},
+        "+ môn + giờ trống": {"radius": args.radius, "sport_type": "badminton", "date": day.isoformat(), "start": "18:00"},
+    }
+
+
+def bench_direct(args, points):
+    from database import SessionLocal
+    from routes.facilities import NEARBY_PAGE_SIZE, get_nearby_facilities
+
+    db = SessionLocal()
+    try:
+        for name, params in cases(args).items():
+            latencies = []
+            for lat, lng in points:
+                started = time.perf_counter()
+                get_nearby_facilities(
+                    lat=lat, lng=lng, radius=params["radius"], sport_type=params.get("sport_type"),
+                    on_date=date.fromisoformat(params["date"]) if "date" in params else None,
+                    start=params.get("start"), duration_minutes=60, limit=NEARBY_PAGE_SIZE, db=db,
+                )
+                latencies.append(time.perf_counter() - started)
+                db.rollback()
+            print(f"[trực tiếp] {name:<20} {percentiles(latencies)}")
+    finally:
+        db.close()
+
+
+async def bench_http(args, points):
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+        for name, params in cases(args).items():
+            latencies = []
+            for lat, lng in points:
+                started = time.perf_counter()
+                response = await client.get("/api/facilities/nearby", params={"lat": lat, "lng": lng, **params})
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+            print(f"[http]      {name:<20} {percentiles(latencies)}")
+
+
+def main(args):
+    seed_facilities(args.facilities, args.lat, args.lng, args.spread)
+    rng = random.Random(7)
+    points = [random_point(rng, args.lat, args.lng, args.spread) for _ in range(args.requests)]
+    # Lượt đầu làm nóng cache (availability, plan của Postgres), không tính
+    bench_direct(args, points[:20])
+    print("---")
+    bench_direct(args, points)
+    if not args.skip_http:
+        asyncio.run(bench_http(args, points))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--facilities", type=int, default=50000)
+    parser.add_argument("--lat", type=float, default=21.0285, help="tâm vùng thử (mặc định Hà Nội)")
+    parser.add_argument("--lng", type=float, default=105.8542)
+    parser.add_argument("--spread", type=float, default=30.0, help="bán kính vùng rải sân (km)")
+    parser.add_argument("--radius", type=float, default=5000, help="bán kính tìm (mét)")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--skip-http", action="store_true")
+    main(parser.parse_args())